@@ -0,0 +1,103 @@
+import os
+from typing import List, Optional
+
+import numpy as np
+from ultralytics import YOLO
+
+# Backends suportados. "pytorch" carrega o best.pt diretamente; "onnx" e "openvino"
+# usam um runtime otimizado para CPU a partir de um modelo exportado.
+BACKENDS = ("pytorch", "onnx", "openvino")
+
+# Sufixo/formato gerado pelo `YOLO.export` para cada backend
+_EXPORT_FORMATS = {"onnx": "onnx", "openvino": "openvino"}
+
+
+class InferenceBackend:
+    """
+    Interface comum dos backends de inferência.
+
+    `predict` recebe uma lista de frames BGR e retorna, para cada um, um array (N, 6)
+    com x1, y1, x2, y2, conf e classe em coordenadas do frame original. Esse é o único
+    formato de resultado consumido por `process_camera` e pelos endpoints USB.
+    `healthy` indica se o backend consegue atender chamadas (verificado pelo /health).
+    """
+
+    name = "base"
+    healthy = True
+
+    def predict(self, frames: List[np.ndarray], conf: float = 0.5, imgsz: Optional[int] = None) -> List[np.ndarray]:
+        raise NotImplementedError
+
+
+class UltralyticsBackend(InferenceBackend):
+    """
+    Backend baseado no `ultralytics.YOLO`, que carrega tanto o .pt (PyTorch) quanto
+    modelos exportados (.onnx via ONNX Runtime, diretório *_openvino_model via OpenVINO).
+    """
+
+    def __init__(self, model_path: str, device: str = "cpu", name: str = "pytorch"):
+        self.name = name
+        self.model_path = model_path
+        self.device = device
+        self.model = YOLO(model_path, task="detect")
+        if name == "pytorch":
+            self.model.to(device)
+
+    @property
+    def names(self):
+        return self.model.names
+
+    def predict(self, frames: List[np.ndarray], conf: float = 0.5, imgsz: Optional[int] = None) -> List[np.ndarray]:
+        kwargs = {"imgsz": imgsz} if imgsz else {}
+        resultados = self.model.predict(source=frames, conf=conf, device=self.device, verbose=False, **kwargs)
+        return [r.boxes.data.cpu().numpy() for r in resultados]
+
+
+def detect_backend(model_path: str) -> Optional[str]:
+    """
+    Identifica o backend pelo formato do arquivo, quando o MODEL_PATH já aponta para um modelo exportado.
+    """
+    path = model_path.rstrip("/")
+    if path.endswith(".onnx"):
+        return "onnx"
+    if path.endswith("_openvino_model") or path.endswith(".xml"):
+        return "openvino"
+    return None
+
+
+def export_model(pt_path: str, backend: str) -> str:
+    """
+    Exporta o .pt para o formato do backend, reaproveitando uma exportação anterior se existir.
+    O modelo é exportado com batch dinâmico para permitir a inferência em lote.
+    """
+    base, _ = os.path.splitext(pt_path)
+    destino = base + ".onnx" if backend == "onnx" else base + "_openvino_model"
+    if os.path.exists(destino) and os.path.getmtime(destino) >= os.path.getmtime(pt_path):
+        return destino
+    print(f"Exportando {pt_path} para {backend}...")
+    return YOLO(pt_path).export(format=_EXPORT_FORMATS[backend], dynamic=True, half=False)
+
+
+def load_backend(model_path: str, backend: str = "pytorch", device: str = "cpu") -> InferenceBackend:
+    """
+    Carrega o backend solicitado. Se o MODEL_PATH já for um modelo exportado, o backend é
+    deduzido do arquivo. Qualquer falha no backend otimizado cai para o PyTorch, desde que
+    o MODEL_PATH seja um .pt.
+    """
+    backend = (detect_backend(model_path) or backend or "pytorch").lower()
+    if backend not in BACKENDS:
+        print(f"[AVISO] Backend de inferência desconhecido '{backend}', usando pytorch.")
+        backend = "pytorch"
+
+    if backend == "pytorch":
+        return UltralyticsBackend(model_path, device, "pytorch")
+
+    try:
+        caminho = model_path if detect_backend(model_path) else export_model(model_path, backend)
+        # Runtimes de CPU: o dispositivo é sempre CPU
+        return UltralyticsBackend(caminho, "cpu", backend)
+    except Exception as e:
+        if detect_backend(model_path):
+            raise
+        print(f"[AVISO] Falha ao carregar o backend {backend} ({e}); usando pytorch.")
+        return UltralyticsBackend(model_path, device, "pytorch")
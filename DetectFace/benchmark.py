@@ -0,0 +1,442 @@
+"""
+Benchmark reproduzível do pipeline do DetectFace.
+
+Usa arquivos de vídeo locais (sintéticos ou gravados) no lugar das câmeras IP e executa
+o servidor real (`server.py`) no próprio processo. Cenários:
+
+    cameras  N câmeras simuladas rodando o loop de `process_camera`
+    usb      clientes concorrentes enviando frames para /process_usb_frame/
+    mjpeg    espectadores concorrentes em /video/stream de uma câmera
+
+Uso:
+    python benchmark.py --saida resultados/base.json
+    python benchmark.py --video gravacao.mp4 --cameras 1,4,16 --viewers 1,50,200 --duracao 30
+    python benchmark.py --comparar resultados/base.json resultados/nova.json
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import resource
+import socket
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+from typing import Dict, List
+
+import cv2
+import numpy as np
+
+# Arquivos de vídeo terminam: reabre imediatamente para o vídeo rodar em loop
+os.environ.setdefault("CAMERA_READ_FAILURES", "1")
+os.environ.setdefault("CAMERA_MAX_RETRIES", "0")
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# Separador de cada frame no multipart do /video/stream
+DELIMITADOR_MJPEG = b"--frame\r\n"
+
+
+# --- Utilitários ---
+def percentis(amostras: List[float]) -> Dict[str, float]:
+    if not amostras:
+        return {"p50": None, "p95": None, "p99": None, "amostras": 0}
+    p50, p95, p99 = np.percentile(amostras, [50, 95, 99])
+    return {"p50": round(float(p50) * 1000, 2), "p95": round(float(p95) * 1000, 2),
+            "p99": round(float(p99) * 1000, 2), "amostras": len(amostras)}
+
+
+class MedidorRecursos:
+    """
+    Mede uso de CPU (núcleos equivalentes) e memória RSS do processo, incluindo os
+    processos de inferência quando o psutil está disponível.
+    """
+
+    def __init__(self):
+        self._proc = psutil.Process() if psutil else None
+
+    def _cpu(self) -> float:
+        if self._proc:
+            processos = [self._proc] + self._proc.children(recursive=True)
+            total = 0.0
+            for p in processos:
+                try:
+                    t = p.cpu_times()
+                    total += t.user + t.system
+                except psutil.Error:
+                    pass
+            return total
+        uso = resource.getrusage(resource.RUSAGE_SELF)
+        return uso.ru_utime + uso.ru_stime
+
+    def _rss_mb(self) -> float:
+        if self._proc:
+            total = 0
+            for p in [self._proc] + self._proc.children(recursive=True):
+                try:
+                    total += p.memory_info().rss
+                except psutil.Error:
+                    pass
+            return total / 1e6
+        # Sem psutil: pico de RSS (ru_maxrss em KB no Linux)
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3
+
+    def __enter__(self):
+        self._inicio, self._cpu_inicio = time.perf_counter(), self._cpu()
+        return self
+
+    def __exit__(self, *exc):
+        self.duracao = time.perf_counter() - self._inicio
+        self.cpu_cores = (self._cpu() - self._cpu_inicio) / self.duracao if self.duracao else 0.0
+        self.rss_mb = self._rss_mb()
+
+    def resumo(self) -> Dict[str, float]:
+        return {"duracao_s": round(self.duracao, 2), "cpu_cores": round(self.cpu_cores, 2), "rss_mb": round(self.rss_mb, 1)}
+
+
+def gerar_video(caminho: str, segundos: int = 10, fps: int = 20, tamanho=(1280, 720)):
+    """
+    Gera um vídeo sintético com elipses em movimento sobre um fundo com ruído.
+    """
+    largura, altura = tamanho
+    writer = cv2.VideoWriter(caminho, cv2.VideoWriter_fourcc(*"MJPG"), fps, tamanho)
+    rng = np.random.default_rng(42)
+    fundo = np.tile(np.linspace(40, 200, largura, dtype=np.uint8)[None, :, None], (altura, 1, 3))
+    for i in range(segundos * fps):
+        # cv2.add satura em 255 em vez de dar a volta como a soma de uint8 do numpy
+        frame = cv2.add(fundo, rng.integers(0, 12, fundo.shape, dtype=np.uint8))
+        for k in range(3):
+            cx = int((largura * (0.2 + 0.3 * k) + i * (4 + k)) % largura)
+            cy = int(altura * 0.5 + np.sin(i / 10 + k) * altura * 0.2)
+            cv2.ellipse(frame, (cx, cy), (60, 80), 0, 0, 360, (140, 170, 210), -1)
+        writer.write(frame)
+    writer.release()
+
+
+def jpeg_de_exemplo(video: str) -> bytes:
+    cap = cv2.VideoCapture(video)
+    ok, frame = cap.read()
+    cap.release()
+    if not ok:
+        raise SystemExit(f"Não foi possível ler {video}")
+    return cv2.imencode(".jpg", frame)[1].tobytes()
+
+
+class ServidorLocal:
+    """
+    Executa o app FastAPI do server.py com uvicorn em uma thread, em uma porta livre.
+    """
+
+    def __init__(self, server):
+        import uvicorn
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            self.porta = s.getsockname()[1]
+        self._uvicorn = uvicorn.Server(uvicorn.Config(server.app, host="127.0.0.1", port=self.porta, log_level="warning"))
+        threading.Thread(target=self._uvicorn.run, daemon=True).start()
+        while not self._uvicorn.started:
+            time.sleep(0.05)
+
+    def parar(self):
+        self._uvicorn.should_exit = True
+
+
+class HistogramaGravador:
+    """
+    Substitui um histograma do server.py guardando também as amostras brutas,
+    para calcular percentis exatos.
+    """
+
+    def __init__(self, original):
+        self.original = original
+        self.amostras: List[float] = []
+        self._lock = threading.Lock()
+
+    def observe(self, valor, *labels):
+        self.original.observe(valor, *labels)
+        with self._lock:
+            self.amostras.append(valor)
+
+    def remove(self, *labels):
+        self.original.remove(*labels)
+
+    def render(self):
+        return self.original.render()
+
+    def reset(self):
+        with self._lock:
+            self.amostras = []
+
+
+# --- Cenários ---
+def iniciar_cameras(server, videos: List[str], n: int, pasta: str) -> List[str]:
+    """
+    Inicia N câmeras simuladas. Cada câmera usa um link próprio para o vídeo, pois a
+    URL é o identificador da câmera.
+    """
+    urls = []
+    for i in range(n):
+        link = os.path.join(pasta, f"camera_{n}_{i}{os.path.splitext(videos[i % len(videos)])[1]}")
+        if not os.path.exists(link):
+            os.symlink(os.path.abspath(videos[i % len(videos)]), link)
+        if server.launch_camera(server.CameraRequest(url=link)) != "started":
+            raise SystemExit(f"Não foi possível iniciar a câmera simulada {link} (verifique MAX_CAMERAS)")
+        urls.append(link)
+
+    limite = time.monotonic() + 60
+    while time.monotonic() < limite:
+        estados = [server.camera_registry.get(u) for u in urls]
+        prontas = sum(1 for c in estados if c is not None and c.snapshot.status == "running")
+        if prontas == n:
+            break
+        time.sleep(0.2)
+    return urls
+
+
+def parar_cameras(server, urls: List[str]):
+    workers = [c.worker for c in (server.camera_registry.get(u) for u in urls) if c is not None]
+    for worker in workers:
+        if worker is not None:
+            worker.stop()
+    for worker in workers:
+        if worker is not None:
+            worker.thread.join(timeout=10)
+
+
+def cenario_cameras(server, videos, n, duracao, pasta) -> Dict:
+    idade, inferencia = HistogramaGravador(server.M_FRAME_AGE), HistogramaGravador(server.M_INFERENCE)
+    server.M_FRAME_AGE, server.M_INFERENCE = idade, inferencia
+    try:
+        urls = iniciar_cameras(server, videos, n, pasta)
+        time.sleep(min(5.0, duracao / 4))  # aquecimento
+        idade.reset()
+        inferencia.reset()
+        with MedidorRecursos() as recursos:
+            time.sleep(duracao)
+        frames = len(idade.amostras)
+        descartados = sum(c.worker.ring.dropped for c in (server.camera_registry.get(u) for u in urls) if c is not None)
+        parar_cameras(server, urls)
+    finally:
+        server.M_FRAME_AGE, server.M_INFERENCE = idade.original, inferencia.original
+
+    return {
+        "cameras": n,
+        "frames_por_segundo": round(frames / recursos.duracao, 2),
+        "fps_por_camera": round(frames / recursos.duracao / n, 2),
+        "idade_frame_ms": percentis(idade.amostras),
+        "inferencia_ms": percentis(inferencia.amostras),
+        "frames_descartados": descartados,
+        **recursos.resumo(),
+    }
+
+
+def _multipart(jpeg: bytes):
+    boundary = "----detectfacebenchmark"
+    corpo = (f"--{boundary}\r\nContent-Disposition: form-data; name=\"frame\"; filename=\"frame.jpg\"\r\n"
+             f"Content-Type: image/jpeg\r\n\r\n").encode() + jpeg + f"\r\n--{boundary}--\r\n".encode()
+    return corpo, f"multipart/form-data; boundary={boundary}"
+
+
+def cenario_usb(servidor: ServidorLocal, token: str, jpeg: bytes, clientes: int, duracao: float) -> Dict:
+    corpo, content_type = _multipart(jpeg)
+    latencias, status = [], {}
+    lock = threading.Lock()
+    fim = time.monotonic() + duracao
+
+    def cliente():
+        conn = http.client.HTTPConnection("127.0.0.1", servidor.porta, timeout=30)
+        while time.monotonic() < fim:
+            inicio = time.perf_counter()
+            conn.request("POST", "/process_usb_frame/", body=corpo,
+                         headers={"Content-Type": content_type, "Authorization": f"Bearer {token}"})
+            resposta = conn.getresponse()
+            resposta.read()
+            with lock:
+                latencias.append(time.perf_counter() - inicio)
+                status[resposta.status] = status.get(resposta.status, 0) + 1
+        conn.close()
+
+    with MedidorRecursos() as recursos:
+        threads = [threading.Thread(target=cliente) for _ in range(clientes)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+    return {
+        "clientes": clientes,
+        "requisicoes_por_segundo": round(len(latencias) / recursos.duracao, 2),
+        "latencia_ms": percentis(latencias),
+        "status": {str(k): v for k, v in status.items()},
+        **recursos.resumo(),
+    }
+
+
+def cenario_mjpeg(server, servidor: ServidorLocal, videos, viewers: int, duracao: float, pasta) -> Dict:
+    urls = iniciar_cameras(server, videos, 1, pasta)
+    caminho = "/video/stream?camera_url=" + urllib.parse.quote_plus(urls[0])
+    parar = threading.Event()
+    intervalos, frames = [], [0] * viewers
+    lock = threading.Lock()
+
+    def espectador(i):
+        conn = http.client.HTTPConnection("127.0.0.1", servidor.porta, timeout=2)
+        conn.request("GET", caminho)
+        resposta = conn.getresponse()
+        cauda, ultimo = b"", None
+        while not parar.is_set():
+            try:
+                dados = resposta.read1(65536)
+            except socket.timeout:
+                continue
+            if not dados:
+                break
+            janela = cauda + dados
+            novos = janela.count(DELIMITADOR_MJPEG)
+            # Guarda só um byte a menos que o delimitador: um delimitador completo no fim do
+            # bloco já foi contado e não pode ser contado de novo na próxima leitura
+            cauda = janela[-(len(DELIMITADOR_MJPEG) - 1):]
+            if novos:
+                agora = time.perf_counter()
+                with lock:
+                    frames[i] += novos
+                    if ultimo is not None:
+                        intervalos.append(agora - ultimo)
+                ultimo = agora
+        conn.close()
+
+    threads = [threading.Thread(target=espectador, args=(i,), daemon=True) for i in range(viewers)]
+    for t in threads:
+        t.start()
+    time.sleep(2.0)
+    with lock:
+        frames[:] = [0] * viewers
+        intervalos.clear()
+    with MedidorRecursos() as recursos:
+        time.sleep(duracao)
+        with lock:
+            total = sum(frames)
+    parar.set()
+    for t in threads:
+        t.join(timeout=5)
+    parar_cameras(server, urls)
+
+    return {
+        "espectadores": viewers,
+        "frames_entregues_por_segundo": round(total / recursos.duracao, 2),
+        "fps_por_espectador": round(total / recursos.duracao / viewers, 2),
+        "intervalo_entre_frames_ms": percentis(intervalos),
+        **recursos.resumo(),
+    }
+
+
+# --- Comparação ---
+def comparar(base: str, nova: str):
+    """
+    Mostra a variação percentual das métricas principais entre duas execuções.
+    """
+    with open(base) as f:
+        a = json.load(f)
+    with open(nova) as f:
+        b = json.load(f)
+    chaves = {"cameras": ("cameras", ["frames_por_segundo", "cpu_cores", "rss_mb"]),
+              "usb": ("clientes", ["requisicoes_por_segundo", "cpu_cores"]),
+              "mjpeg": ("espectadores", ["frames_entregues_por_segundo", "cpu_cores"])}
+    for cenario, (chave, campos) in chaves.items():
+        antigos = {r[chave]: r for r in a.get(cenario, [])}
+        for novo in b.get(cenario, []):
+            antigo = antigos.get(novo[chave])
+            if not antigo:
+                continue
+            partes = []
+            for campo in campos:
+                va, vb = antigo[campo], novo[campo]
+                delta = (vb - va) / va * 100 if va else 0.0
+                partes.append(f"{campo}: {va} -> {vb} ({delta:+.1f}%)")
+            print(f"[{cenario} {chave}={novo[chave]}] " + "; ".join(partes))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do pipeline do DetectFace")
+    parser.add_argument("--video", default="", help="Vídeos gravados separados por vírgula (padrão: sintético)")
+    parser.add_argument("--cameras", default="1,4,16,64")
+    parser.add_argument("--viewers", default="1,10,50,200")
+    parser.add_argument("--usb-clients", default="1,4,16")
+    parser.add_argument("--cenarios", default="cameras,usb,mjpeg")
+    parser.add_argument("--duracao", type=float, default=20.0, help="Segundos de medição por ponto")
+    parser.add_argument("--saida", default="benchmark.json")
+    parser.add_argument("--comparar", nargs=2, metavar=("BASE", "NOVA"))
+    args = parser.parse_args()
+
+    if args.comparar:
+        comparar(*args.comparar)
+        return
+
+    pasta = tempfile.mkdtemp(prefix="detectface-bench-")
+    videos = [v for v in args.video.split(",") if v]
+    if not videos:
+        videos = [os.path.join(pasta, "sintetico.avi")]
+        gerar_video(videos[0])
+
+    cameras = [int(n) for n in args.cameras.split(",") if n]
+    os.environ.setdefault("MAX_CAMERAS", str(max(cameras + [1])))
+
+    import jwt
+    import server
+    if server.modelo is None:
+        raise SystemExit("Modelo não carregado; verifique MODEL_PATH")
+
+    cenarios = set(args.cenarios.split(","))
+    resultados = {
+        "meta": {
+            "data": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": sys.version.split()[0],
+            "plataforma": platform.platform(),
+            "cpus": os.cpu_count(),
+            "backend": server.modelo.name,
+            "videos": videos,
+            "duracao_s": args.duracao,
+            "config": {k: v for k, v in os.environ.items()
+                       if k.startswith(("INFERENCE_", "CAPTURE_", "MJPEG_", "USB_", "CAMERA_", "MAX_CAMERAS"))},
+        },
+        "cameras": [],
+        "usb": [],
+        "mjpeg": [],
+    }
+
+    if "cameras" in cenarios:
+        for n in cameras:
+            print(f"[BENCH] {n} câmeras...")
+            resultados["cameras"].append(cenario_cameras(server, videos, n, args.duracao, pasta))
+            print(f"        {resultados['cameras'][-1]}")
+
+    servidor = ServidorLocal(server) if cenarios & {"usb", "mjpeg"} else None
+    if "usb" in cenarios:
+        token = jwt.encode({"sub": "benchmark", "exp": int(time.time()) + 24 * 3600}, server.SECRET_KEY, algorithm="HS256")
+        jpeg = jpeg_de_exemplo(videos[0])
+        for clientes in [int(n) for n in args.usb_clients.split(",") if n]:
+            print(f"[BENCH] USB com {clientes} clientes...")
+            resultados["usb"].append(cenario_usb(servidor, token, jpeg, clientes, args.duracao))
+            print(f"        {resultados['usb'][-1]}")
+    if "mjpeg" in cenarios:
+        for viewers in [int(n) for n in args.viewers.split(",") if n]:
+            print(f"[BENCH] MJPEG com {viewers} espectadores...")
+            resultados["mjpeg"].append(cenario_mjpeg(server, servidor, videos, viewers, args.duracao, pasta))
+            print(f"        {resultados['mjpeg'][-1]}")
+    if servidor:
+        servidor.parar()
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.saida)), exist_ok=True)
+    with open(args.saida, "w") as f:
+        json.dump(resultados, f, indent=2)
+    print(f"[BENCH] Resultados salvos em {args.saida}")
+
+
+if __name__ == "__main__":
+    main()
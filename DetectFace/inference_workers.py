@@ -0,0 +1,206 @@
+import atexit
+import itertools
+import multiprocessing as mp
+import os
+import queue
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from multiprocessing import shared_memory
+from typing import Dict, List, Optional
+
+import cv2
+import numpy as np
+
+from backends import InferenceBackend, detect_backend, export_model, load_backend
+
+# Tamanho padrão de cada slot de memória compartilhada: um frame BGR 1080p
+DEFAULT_SLOT_BYTES = 1920 * 1080 * 3
+
+
+def _worker_main(model_path: str, backend: str, device: str, shm_names: List[str], tasks, results, threads: int):
+    """
+    Processo de inferência: carrega o modelo uma vez e lê os frames diretamente dos slots
+    de memória compartilhada (sem nova cópia nem serialização dos pixels).
+    """
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except Exception:
+        pass
+
+    slots = [shared_memory.SharedMemory(name=name) for name in shm_names]
+    try:
+        modelo = load_backend(model_path, backend, device)
+    except Exception as e:
+        results.put(("fatal", -1, f"processo {os.getpid()}: {e}"))
+        return
+
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        job, specs, conf, imgsz = task
+        try:
+            frames = [np.ndarray(shape, dtype=np.uint8, buffer=slots[idx].buf) for idx, shape in specs]
+            results.put(("ok", job, modelo.predict(frames, conf=conf, imgsz=imgsz)))
+        except Exception as e:
+            results.put(("error", job, str(e)))
+
+    for slot in slots:
+        slot.close()
+
+
+class ProcessPoolBackend(InferenceBackend):
+    """
+    Executa a inferência em N processos, cada um com sua própria cópia do modelo.
+
+    Cada frame é copiado uma vez para um slot de `multiprocessing.shared_memory`
+    pré-alocado e os processos criam arrays numpy sobre esses slots; pela fila trafegam
+    apenas os índices dos slots e as caixas de resultado. Chamadas concorrentes a `predict`
+    (uma por thread do agendador) são distribuídas entre os processos livres.
+
+    Se todos os processos falharem ao carregar o modelo (ou morrerem), `healthy` passa a
+    False e as chamadas pendentes e futuras falham imediatamente.
+    """
+
+    def __init__(self, model_path: str, backend: str = "pytorch", device: str = "cpu", processes: int = 2,
+                 slots: Optional[int] = None, slot_bytes: int = DEFAULT_SLOT_BYTES, timeout: float = 30.0):
+        processes = max(1, processes)
+        # Exporta uma única vez no processo principal, para os workers não competirem pelo arquivo
+        if backend in ("onnx", "openvino") and not detect_backend(model_path):
+            try:
+                model_path = export_model(model_path, backend)
+            except Exception as e:
+                print(f"[AVISO] Falha ao exportar para {backend} ({e}); usando pytorch.")
+                backend = "pytorch"
+
+        self.name = f"{detect_backend(model_path) or backend} x{processes} processos"
+        self.model_path = model_path
+        self.slot_bytes = slot_bytes
+        self.timeout = timeout
+        self._shms = [shared_memory.SharedMemory(create=True, size=slot_bytes) for _ in range(slots or processes * 4)]
+        self._free: "queue.Queue[int]" = queue.Queue()
+        for idx in range(len(self._shms)):
+            self._free.put(idx)
+
+        ctx = mp.get_context("spawn")
+        self._tasks = ctx.Queue()
+        self._results = ctx.Queue()
+        self._pending: Dict[int, Future] = {}
+        # Slots de jobs que expiraram: o worker ainda pode estar lendo, então só voltam ao pool na resposta
+        self._quarantine: Dict[int, List[int]] = {}
+        self._lock = threading.Lock()
+        self._ids = itertools.count()
+        self._failure: Optional[str] = None
+        self._fatal = 0
+
+        threads = max(1, (os.cpu_count() or 1) // processes)
+        names = [shm.name for shm in self._shms]
+        self._procs = [
+            ctx.Process(target=_worker_main, args=(model_path, backend, device, names, self._tasks, self._results, threads),
+                        name=f"inference-worker-{i}", daemon=True)
+            for i in range(processes)
+        ]
+        for proc in self._procs:
+            proc.start()
+        threading.Thread(target=self._read_results, name="inference-results", daemon=True).start()
+        atexit.register(self.close)
+
+    def _read_results(self):
+        while True:
+            try:
+                kind, job, payload = self._results.get()
+            except (EOFError, OSError, TypeError):
+                break
+            if kind == "fatal":
+                print(f"[ERRO] Worker de inferência falhou ao carregar o modelo: {payload}")
+                self._fatal += 1
+                if self._fatal >= len(self._procs):
+                    self._failure = payload
+                    # Ninguém mais vai responder: falha as chamadas em espera em vez de esperar o timeout
+                    with self._lock:
+                        pendentes, self._pending = self._pending, {}
+                    for future in pendentes.values():
+                        future.set_exception(RuntimeError(f"Workers de inferência indisponíveis: {payload}"))
+                continue
+            with self._lock:
+                future = self._pending.pop(job, None)
+                liberados = self._quarantine.pop(job, [])
+            for idx in liberados:
+                self._free.put(idx)
+            if future is None:
+                continue
+            if kind == "ok":
+                future.set_result(payload)
+            else:
+                future.set_exception(RuntimeError(payload))
+
+    @property
+    def healthy(self) -> bool:
+        return self._failure is None and any(proc.is_alive() for proc in self._procs)
+
+    def _fit(self, frame: np.ndarray):
+        """
+        Garante que o frame cabe em um slot; frames maiores são reduzidos e a escala é devolvida.
+        """
+        if frame.nbytes <= self.slot_bytes:
+            return frame, 1.0
+        escala = (self.slot_bytes / frame.nbytes) ** 0.5 * 0.99
+        h, w = frame.shape[:2]
+        return cv2.resize(frame, (int(w * escala), int(h * escala)), interpolation=cv2.INTER_AREA), 1.0 / escala
+
+    def predict(self, frames: List[np.ndarray], conf: float = 0.5, imgsz: Optional[int] = None) -> List[np.ndarray]:
+        if not self.healthy:
+            raise RuntimeError(f"Workers de inferência indisponíveis: {self._failure or 'processos encerrados'}")
+
+        slots, specs, escalas = [], [], []
+        try:
+            for frame in frames:
+                idx = self._free.get(timeout=self.timeout)
+                slots.append(idx)
+                frame, escala = self._fit(frame)
+                destino = np.ndarray(frame.shape, dtype=np.uint8, buffer=self._shms[idx].buf)
+                np.copyto(destino, frame)
+                specs.append((idx, frame.shape))
+                escalas.append(escala)
+
+            job, future = next(self._ids), Future()
+            with self._lock:
+                self._pending[job] = future
+            self._tasks.put((job, specs, conf, imgsz))
+            try:
+                resultados = future.result(timeout=self.timeout)
+            except FutureTimeoutError:
+                with self._lock:
+                    # Se a resposta ainda não chegou, o worker pode estar lendo os slots:
+                    # eles ficam em quarentena até a resposta, em vez de voltarem ao pool
+                    if self._pending.pop(job, None) is not None:
+                        self._quarantine[job], slots = slots, []
+                raise
+            finally:
+                with self._lock:
+                    self._pending.pop(job, None)
+        finally:
+            for idx in slots:
+                self._free.put(idx)
+
+        for boxes, escala in zip(resultados, escalas):
+            if escala != 1.0:
+                boxes[:, :4] *= escala
+        return resultados
+
+    def close(self):
+        for _ in self._procs:
+            try:
+                self._tasks.put(None)
+            except Exception:
+                pass
+        for proc in self._procs:
+            proc.join(timeout=5)
+        for shm in self._shms:
+            try:
+                shm.close()
+                shm.unlink()
+            except FileNotFoundError:
+                pass
+        self._shms = []
@@ -0,0 +1,103 @@
+import bisect
+import threading
+from typing import Dict, List, Sequence, Tuple
+
+# Buckets (segundos) adequados para etapas de um pipeline de vídeo: de 1 ms a 10 s
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pares = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pares.append(extra)
+    return "{" + ",".join(pares) + "}" if pares else ""
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._series: Dict[Tuple[str, ...], object] = {}
+
+    def remove(self, *labels: str):
+        with self._lock:
+            self._series.pop(tuple(labels), None)
+
+    def _header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, *labels: str):
+        with self._lock:
+            self._series[tuple(labels)] = float(value)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            series = list(self._series.items())
+        return self._header() + [f"{self.name}{_labels(self.labelnames, k)} {v}" for k, v in series]
+
+
+class Counter(Gauge):
+    """
+    Contador monotônico. `set` é usado para exportar contadores mantidos em outro lugar.
+    """
+
+    kind = "counter"
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        with self._lock:
+            chave = tuple(labels)
+            self._series[chave] = self._series.get(chave, 0.0) + amount
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labels: str):
+        with self._lock:
+            chave = tuple(labels)
+            serie = self._series.get(chave)
+            if serie is None:
+                # [contagens por bucket..., +Inf], soma
+                serie = self._series[chave] = [[0] * (len(self.buckets) + 1), 0.0]
+            serie[0][bisect.bisect_left(self.buckets, value)] += 1
+            serie[1] += value
+
+    def render(self) -> List[str]:
+        with self._lock:
+            series = [(k, list(v[0]), v[1]) for k, v in self._series.items()]
+        linhas = self._header()
+        for chave, contagens, soma in series:
+            acumulado = 0
+            for limite, contagem in zip(self.buckets + (float("inf"),), contagens):
+                acumulado += contagem
+                le = 'le="+Inf"' if limite == float("inf") else f'le="{limite}"'
+                linhas.append(f"{self.name}_bucket{_labels(self.labelnames, chave, le)} {acumulado}")
+            linhas.append(f"{self.name}_sum{_labels(self.labelnames, chave)} {soma}")
+            linhas.append(f"{self.name}_count{_labels(self.labelnames, chave)} {acumulado}")
+        return linhas
+
+
+def render(metrics: Sequence[_Metric]) -> str:
+    """
+    Gera o texto no formato de exposição do Prometheus (text/plain; version=0.0.4).
+    """
+    linhas: List[str] = []
+    for metric in metrics:
+        linhas.extend(metric.render())
+    return "\n".join(linhas) + "\n"
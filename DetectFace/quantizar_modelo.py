@@ -0,0 +1,247 @@
+"""
+Ferramenta de quantização INT8 do modelo de detecção facial.
+
+Uso:
+    # Gera best_int8.onnx calibrado com as imagens de uma pasta (quantização estática)
+    python quantizar_modelo.py quantizar --modelo best.pt --imagens calibracao/ --saida best_int8.onnx
+
+    # Quantização dinâmica (não precisa de calibração representativa)
+    python quantizar_modelo.py quantizar --modelo best.pt --modo dinamico
+
+    # Compara o modelo quantizado com o FP32: concordância de contagem, mAP e desempenho
+    python quantizar_modelo.py comparar --referencia best.pt --candidato best_int8.onnx --imagens validacao/
+
+Depois de validado, basta apontar MODEL_PATH para o .onnx quantizado; o backend ONNX é
+selecionado automaticamente pela extensão do arquivo.
+"""
+import argparse
+import glob
+import json
+import os
+import time
+from typing import Dict, List
+
+import cv2
+import numpy as np
+
+from backends import export_model, load_backend
+from tracker import iou_matrix
+
+EXTENSOES_IMAGEM = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+def listar_imagens(pasta: str, limite: int = 0) -> List[str]:
+    caminhos = sorted(p for p in glob.glob(os.path.join(pasta, "**", "*"), recursive=True)
+                      if p.lower().endswith(EXTENSOES_IMAGEM))
+    return caminhos[:limite] if limite else caminhos
+
+
+def letterbox(img: np.ndarray, imgsz: int) -> np.ndarray:
+    """
+    Redimensiona mantendo a proporção e completa com cinza, como no pré-processamento do ultralytics.
+    Retorna o tensor NCHW float32 normalizado em [0, 1], em RGB.
+    """
+    h, w = img.shape[:2]
+    escala = min(imgsz / h, imgsz / w)
+    nh, nw = int(round(h * escala)), int(round(w * escala))
+    canvas = np.full((imgsz, imgsz, 3), 114, dtype=np.uint8)
+    top, left = (imgsz - nh) // 2, (imgsz - nw) // 2
+    canvas[top:top + nh, left:left + nw] = cv2.resize(img, (nw, nh), interpolation=cv2.INTER_LINEAR)
+    return np.ascontiguousarray(canvas[:, :, ::-1].transpose(2, 0, 1)[None], dtype=np.float32) / 255.0
+
+
+# --- Quantização ---
+def quantizar(modelo: str, imagens: str, saida: str, modo: str, imgsz: int, limite: int):
+    from onnxruntime.quantization import (CalibrationDataReader, QuantFormat, QuantType,
+                                          quantize_dynamic, quantize_static)
+    import onnx
+
+    fp32 = modelo if modelo.endswith(".onnx") else export_model(modelo, "onnx")
+    print(f"Modelo FP32 (ONNX): {fp32}")
+
+    if modo == "dinamico":
+        quantize_dynamic(fp32, saida, weight_type=QuantType.QInt8)
+    else:
+        caminhos = listar_imagens(imagens, limite)
+        if not caminhos:
+            raise SystemExit(f"Nenhuma imagem de calibração encontrada em {imagens}")
+        nome_entrada = onnx.load(fp32, load_external_data=False).graph.input[0].name
+
+        class LeitorCalibracao(CalibrationDataReader):
+            def __init__(self):
+                self._iter = iter(caminhos)
+
+            def get_next(self):
+                for caminho in self._iter:
+                    img = cv2.imread(caminho)
+                    if img is not None:
+                        return {nome_entrada: letterbox(img, imgsz)}
+                return None
+
+        print(f"Calibrando com {len(caminhos)} imagens...")
+        quantize_static(fp32, saida, LeitorCalibracao(), quant_format=QuantFormat.QDQ,
+                        activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8)
+
+    # O ultralytics lê nomes das classes, stride e imgsz dos metadados do ONNX
+    original, quantizado = onnx.load(fp32), onnx.load(saida)
+    del quantizado.metadata_props[:]
+    quantizado.metadata_props.extend(original.metadata_props)
+    onnx.save(quantizado, saida)
+
+    def tamanho(caminho: str) -> float:
+        return os.path.getsize(caminho) / 1e6
+
+    print(f"Modelo INT8 salvo em {saida} ({tamanho(fp32):.1f} MB -> {tamanho(saida):.1f} MB)")
+
+
+# --- Comparação ---
+def average_precision(candidatos: List[np.ndarray], referencias: List[np.ndarray], limiar_iou: float) -> float:
+    """
+    AP do candidato usando as detecções do modelo de referência como ground truth
+    (interpolação de 101 pontos, como no COCO).
+    """
+    total_ref = sum(len(r) for r in referencias)
+    if total_ref == 0:
+        return 1.0 if sum(len(c) for c in candidatos) == 0 else 0.0
+
+    scores, acertos = [], []
+    for cand, ref in zip(candidatos, referencias):
+        if len(cand) == 0:
+            continue
+        ordem = np.argsort(-cand[:, 4])
+        cand = cand[ordem]
+        ious = iou_matrix(cand[:, :4], ref[:, :4])
+        usados = set()
+        for i in range(len(cand)):
+            acerto = False
+            if ious.shape[1]:
+                for j in np.argsort(-ious[i]):
+                    if ious[i, j] < limiar_iou:
+                        break
+                    if j not in usados:
+                        usados.add(j)
+                        acerto = True
+                        break
+            scores.append(cand[i, 4])
+            acertos.append(acerto)
+
+    if not scores:
+        return 0.0
+    ordem = np.argsort(-np.array(scores))
+    tp = np.cumsum(np.array(acertos)[ordem])
+    fp = np.cumsum(~np.array(acertos)[ordem])
+    recall = tp / total_ref
+    precisao = tp / np.maximum(tp + fp, 1e-9)
+    # Envelope monotônico da precisão
+    precisao = np.maximum.accumulate(precisao[::-1])[::-1]
+    pontos = np.linspace(0, 1, 101)
+    indices = np.searchsorted(recall, pontos, side="left")
+    return float(np.mean([precisao[i] if i < len(precisao) else 0.0 for i in indices]))
+
+
+def medir(backend, imagens: List[np.ndarray], conf: float, lote: int) -> Dict:
+    """
+    Executa o backend em todas as imagens, medindo a latência por imagem e a vazão em lote.
+    """
+    backend.predict(imagens[:1], conf=conf)  # aquecimento
+    deteccoes, latencias = [], []
+    for img in imagens:
+        inicio = time.perf_counter()
+        deteccoes.append(backend.predict([img], conf=conf)[0])
+        latencias.append((time.perf_counter() - inicio) * 1000)
+
+    inicio = time.perf_counter()
+    for i in range(0, len(imagens), lote):
+        backend.predict(imagens[i:i + lote], conf=conf)
+    duracao = time.perf_counter() - inicio
+
+    return {
+        "deteccoes": deteccoes,
+        "latencia_ms_p50": float(np.percentile(latencias, 50)),
+        "latencia_ms_p95": float(np.percentile(latencias, 95)),
+        "vazao_fps": len(imagens) / duracao if duracao > 0 else 0.0,
+    }
+
+
+def comparar(referencia: str, candidato: str, imagens: str, conf: float, lote: int, limite: int, saida_json: str):
+    caminhos = listar_imagens(imagens, limite)
+    frames = [img for img in (cv2.imread(p) for p in caminhos) if img is not None]
+    if not frames:
+        raise SystemExit(f"Nenhuma imagem encontrada em {imagens}")
+
+    modelos = {"referencia": load_backend(referencia, "pytorch", "cpu"), "candidato": load_backend(candidato, "onnx", "cpu")}
+    medidas = {nome: medir(backend, frames, conf, lote) for nome, backend in modelos.items()}
+
+    ref, cand = medidas["referencia"]["deteccoes"], medidas["candidato"]["deteccoes"]
+    contagens_ref = np.array([len(d) for d in ref])
+    contagens_cand = np.array([len(d) for d in cand])
+    map50 = average_precision(cand, ref, 0.5)
+    map50_95 = float(np.mean([average_precision(cand, ref, t) for t in np.arange(0.5, 0.96, 0.05)]))
+
+    relatorio = {
+        "imagens": len(frames),
+        "concordancia_contagem": float(np.mean(contagens_ref == contagens_cand)),
+        "erro_medio_contagem": float(np.mean(np.abs(contagens_ref - contagens_cand))),
+        "map50_vs_referencia": map50,
+        "map50_95_vs_referencia": map50_95,
+        "drift_map50": 1.0 - map50,
+        "drift_map50_95": 1.0 - map50_95,
+        "modelos": {
+            nome: {
+                "caminho": modelos[nome].model_path,
+                "backend": modelos[nome].name,
+                **{k: round(v, 2) for k, v in m.items() if k != "deteccoes"},
+            }
+            for nome, m in medidas.items()
+        },
+    }
+
+    print(f"\nImagens avaliadas:           {relatorio['imagens']}")
+    print(f"Concordância de contagem:    {relatorio['concordancia_contagem'] * 100:.1f}%")
+    print(f"Erro médio de contagem:      {relatorio['erro_medio_contagem']:.3f} faces/imagem")
+    print(f"mAP50 vs referência:         {map50:.4f} (drift {1 - map50:.4f})")
+    print(f"mAP50-95 vs referência:      {map50_95:.4f} (drift {1 - map50_95:.4f})\n")
+    print(f"{'modelo':<12}{'backend':<10}{'p50 (ms)':>10}{'p95 (ms)':>10}{'fps (lote)':>12}")
+    for nome, dados in relatorio["modelos"].items():
+        print(f"{nome:<12}{dados['backend']:<10}{dados['latencia_ms_p50']:>10.1f}"
+              f"{dados['latencia_ms_p95']:>10.1f}{dados['vazao_fps']:>12.1f}")
+
+    if saida_json:
+        with open(saida_json, "w") as f:
+            json.dump(relatorio, f, indent=2)
+        print(f"\nRelatório salvo em {saida_json}")
+    return relatorio
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Quantização INT8 e verificação de regressão do modelo de faces.")
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    q = sub.add_parser("quantizar", help="Gera um modelo ONNX INT8 a partir do best.pt")
+    q.add_argument("--modelo", default="best.pt")
+    q.add_argument("--imagens", default="", help="Pasta com imagens de calibração (obrigatória no modo estático)")
+    q.add_argument("--saida", default="best_int8.onnx")
+    q.add_argument("--modo", choices=("estatico", "dinamico"), default="estatico")
+    q.add_argument("--imgsz", type=int, default=640)
+    q.add_argument("--limite", type=int, default=200, help="Máximo de imagens de calibração (0 = todas)")
+
+    c = sub.add_parser("comparar", help="Compara o modelo quantizado com o FP32")
+    c.add_argument("--referencia", default="best.pt")
+    c.add_argument("--candidato", default="best_int8.onnx")
+    c.add_argument("--imagens", required=True, help="Pasta com imagens de validação")
+    c.add_argument("--conf", type=float, default=0.5)
+    c.add_argument("--lote", type=int, default=8)
+    c.add_argument("--limite", type=int, default=0)
+    c.add_argument("--json", default="", help="Arquivo para salvar o relatório")
+
+    args = parser.parse_args()
+    if args.comando == "quantizar":
+        if args.modo == "estatico" and not args.imagens:
+            q.error("--imagens é obrigatório na quantização estática (use --modo dinamico para dispensar a calibração)")
+        quantizar(args.modelo, args.imagens, args.saida, args.modo, args.imgsz, args.limite)
+    else:
+        comparar(args.referencia, args.candidato, args.imagens, args.conf, args.lote, args.limite, args.json)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,31 @@
-from fastapi import FastAPI, Query, Request, HTTPException, Depends, File, UploadFile
-from pydantic import BaseModel
+from fastapi import FastAPI, Query, Request, HTTPException, Depends, File, UploadFile, Form, WebSocket, WebSocketDisconnect
+from pydantic import BaseModel, Field
 import threading
+import asyncio
 import cv2
-from ultralytics import YOLO
 import torch
 import time
 import numpy as np
 import jwt
-from typing import List, Dict
+import logging
+import re
+from typing import List, Dict, NamedTuple, Optional, Tuple
+from collections import OrderedDict
+from concurrent.futures import Future, CancelledError
 from dotenv import load_dotenv
 import os
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import StreamingResponse, PlainTextResponse
 import urllib.parse
+import json
 import io
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from tracker import IoUTracker
+from timeseries import CountStore
+from backends import load_backend
+from inference_workers import ProcessPoolBackend
+import metrics
 
 # --- Configuração Inicial ---
 app = FastAPI(
@@ -43,6 +55,10 @@ app.add_middleware(
 # --- Carregamento do Modelo e Configuração do Dispositivo ---
 # Usa variável de ambiente para o caminho do modelo, com fallback para o padrão
 MODEL_PATH = os.getenv("MODEL_PATH", os.path.join(os.path.dirname(__file__), 'best.pt'))
+# Backend de inferência: pytorch (padrão), onnx ou openvino
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "pytorch")
+# Número de processos de inferência (0 = inferência no próprio processo da API)
+INFERENCE_PROCESSES = int(os.getenv("INFERENCE_PROCESSES", "0"))
 device = 'cuda' if torch.cuda.is_available() else 'cpu'
 print(f"Usando dispositivo: {device}")
 print(f"Caminho do modelo: {MODEL_PATH}")
@@ -50,14 +66,21 @@ print(f"Caminho do modelo: {MODEL_PATH}")
 # Função para carregar o modelo com timeout e retry
 def load_model_with_timeout(model_path, max_retries=3, retry_delay=5):
     """
-    Carrega o modelo YOLO com mecanismo de retry e timeout.
+    Carrega o modelo YOLO no backend configurado, com mecanismo de retry e timeout.
     """
     for attempt in range(max_retries):
         try:
             print(f"Tentativa {attempt + 1}/{max_retries} de carregar o modelo...")
-            modelo = YOLO(model_path)
-            modelo.to(device)
-            print("Modelo carregado com sucesso!")
+            if INFERENCE_PROCESSES > 0:
+                # Cada processo carrega o próprio modelo; os frames trafegam por memória compartilhada
+                modelo = ProcessPoolBackend(
+                    model_path, INFERENCE_BACKEND, device, INFERENCE_PROCESSES,
+                    slots=INFERENCE_PROCESSES * int(os.getenv("INFERENCE_MAX_BATCH", "8")),
+                    slot_bytes=int(float(os.getenv("INFERENCE_SLOT_MB", "6.3")) * 1024 * 1024),
+                )
+            else:
+                modelo = load_backend(model_path, INFERENCE_BACKEND, device)
+            print(f"Modelo carregado com sucesso! (backend: {modelo.name})")
             return modelo
         except Exception as e:
             print(f"Erro ao carregar o modelo (tentativa {attempt + 1}): {e}")
@@ -76,76 +99,908 @@ except Exception as e:
     # Em produção, isso será capturado pelo health check
     modelo = None
 
+# --- Métricas (formato Prometheus) ---
+# Histogramas por câmera de cada etapa do pipeline; os demais valores são coletados no scrape.
+CAMERA_LABEL = ("camera",)
+M_CAPTURE = metrics.Histogram("detectface_capture_seconds", "Tempo de leitura do frame no stream (grab)", CAMERA_LABEL)
+M_DECODE = metrics.Histogram("detectface_decode_seconds", "Tempo de decodificação do frame (retrieve)", CAMERA_LABEL)
+M_INFERENCE = metrics.Histogram("detectface_inference_seconds", "Tempo de espera pela inferência, incluindo a fila do agendador", CAMERA_LABEL)
+M_RENDER = metrics.Histogram("detectface_render_seconds", "Tempo de desenho e codificação JPEG do frame anotado", CAMERA_LABEL)
+M_FRAME_AGE = metrics.Histogram("detectface_frame_age_seconds", "Idade do frame (captura até contagem atualizada)", CAMERA_LABEL)
+M_FPS = metrics.Gauge("detectface_camera_fps", "Taxa de processamento alcançada por câmera", CAMERA_LABEL)
+M_DROPPED = metrics.Counter("detectface_dropped_frames_total", "Frames descartados no ring buffer de captura", CAMERA_LABEL)
+M_SKIPPED = metrics.Counter("detectface_skipped_inferences_total", "Inferências evitadas pelo modo adaptativo", CAMERA_LABEL)
+M_RECONNECTS = metrics.Counter("detectface_camera_reconnects_total", "Reconexões do stream da câmera", CAMERA_LABEL)
+M_VIEWERS = metrics.Gauge("detectface_mjpeg_viewers", "Espectadores conectados em /video/stream", CAMERA_LABEL)
+M_BATCH_SIZE = metrics.Histogram("detectface_batch_size", "Frames por chamada de inferência em lote", buckets=(1, 2, 4, 8, 16, 32, 64))
+M_BATCH_SECONDS = metrics.Histogram("detectface_batch_inference_seconds", "Duração de cada chamada de inferência em lote")
+M_QUEUE = metrics.Gauge("detectface_scheduler_queue_depth", "Frames aguardando no agendador de inferência")
+M_USB = metrics.Histogram("detectface_usb_frame_seconds", "Latência do processamento de frames USB", ("endpoint",))
+M_USB_IN_FLIGHT = metrics.Gauge("detectface_usb_in_flight", "Frames USB em processamento")
+M_USB_REJECTED = metrics.Counter("detectface_usb_rejected_total", "Requisições USB recusadas pelo controle de admissão")
+CAMERA_METRICS = (M_CAPTURE, M_DECODE, M_INFERENCE, M_RENDER, M_FRAME_AGE, M_FPS, M_DROPPED, M_SKIPPED, M_RECONNECTS, M_VIEWERS)
+
+def camera_label(url: str) -> str:
+    """
+    Identificador da câmera nas métricas, sem usuário e senha embutidos na URL.
+    """
+    partes = urllib.parse.urlsplit(url)
+    if "@" not in partes.netloc:
+        return url
+    return urllib.parse.urlunsplit(partes._replace(netloc=partes.netloc.rsplit("@", 1)[1]))
+
+# --- Agendador de Inferência em Lote ---
+# Todas as câmeras compartilham o mesmo modelo. Em vez de cada thread chamar
+# `modelo.predict` isoladamente (disputando a CPU), os frames são enviados a um
+# agendador central que executa uma única predição em lote.
+INFERENCE_MAX_BATCH = int(os.getenv("INFERENCE_MAX_BATCH", "8"))
+INFERENCE_MAX_WAIT_MS = float(os.getenv("INFERENCE_MAX_WAIT_MS", "10"))
+
+class InferenceScheduler:
+    """
+    Agrupa frames de várias câmeras e executa `predict` em lote em um único worker.
+
+    Cada chave (câmera) mantém no máximo um frame pendente: se um novo frame chega
+    antes de o anterior ser processado, o antigo é descartado (o mais recente vence).
+    O worker espera até `max_wait` segundos para completar um lote de `max_batch` frames.
+    Com `workers` > 1 (processos de inferência), vários lotes podem estar em execução ao mesmo tempo.
+    """
+
+    def __init__(self, max_batch: int = 8, max_wait: float = 0.01, workers: int = 1):
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max(0.0, max_wait)
+        self.workers = max(1, workers)
+        self._pending: "OrderedDict[str, tuple]" = OrderedDict()
+        self._cond = threading.Condition()
+        self._threads: List[threading.Thread] = []
+
+    def _ensure_worker(self):
+        self._threads = [t for t in self._threads if t.is_alive()]
+        while len(self._threads) < self.workers:
+            t = threading.Thread(target=self._run, name=f"inference-scheduler-{len(self._threads)}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def submit(self, key: str, frame, conf: float = 0.5, imgsz: Optional[int] = None) -> Future:
+        """
+        Enfileira um frame para a câmera `key` e retorna um Future com as caixas (N, 6).
+        `imgsz` é o tamanho de inferência (None = padrão do modelo).
+        """
+        return self.submit_many([(key, frame, conf, imgsz)])[0]
+
+    def submit_many(self, items: List[Tuple[str, np.ndarray, float, Optional[int]]]) -> List[Future]:
+        """
+        Enfileira vários frames (chave, frame, conf, imgsz) de uma só vez, para que entrem no mesmo lote.
+        """
+        futures = []
+        with self._cond:
+            self._ensure_worker()
+            for key, frame, conf, imgsz in items:
+                future = Future()
+                anterior = self._pending.pop(key, None)
+                if anterior is not None:
+                    # Frame superado por um mais recente da mesma câmera
+                    anterior[3].cancel()
+                self._pending[key] = (frame, conf, imgsz, future)
+                futures.append(future)
+            self._cond.notify()
+        return futures
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._pending)
+
+    def _next_batch(self):
+        with self._cond:
+            while not self._pending:
+                self._cond.wait()
+
+            # Aguarda a chegada de frames de outras câmeras até completar o lote
+            prazo = time.monotonic() + self.max_wait
+            while len(self._pending) < self.max_batch:
+                restante = prazo - time.monotonic()
+                if restante <= 0:
+                    break
+                self._cond.wait(restante)
+
+            lote = []
+            while self._pending and len(lote) < self.max_batch:
+                _, item = self._pending.popitem(last=False)
+                lote.append(item)
+            return lote
+
+    def _run(self):
+        while True:
+            lote = [item for item in self._next_batch() if item[3].set_running_or_notify_cancel()]
+            if not lote:
+                continue
+
+            # Frames com limiares de confiança ou tamanhos de inferência diferentes não podem
+            # dividir a mesma chamada
+            grupos: Dict[Tuple[float, Optional[int]], list] = {}
+            for item in lote:
+                grupos.setdefault((item[1], item[2]), []).append(item)
+
+            for (conf, imgsz), itens in grupos.items():
+                try:
+                    if modelo is None:
+                        raise RuntimeError("Modelo não disponível")
+                    inicio = time.perf_counter()
+                    resultados = modelo.predict([f for f, _, _, _ in itens], conf=conf, imgsz=imgsz)
+                    M_BATCH_SECONDS.observe(time.perf_counter() - inicio)
+                    M_BATCH_SIZE.observe(len(itens))
+                    for (_, _, _, future), boxes in zip(itens, resultados):
+                        future.set_result(boxes)
+                except Exception as e:
+                    print(f"[ERRO] Falha na inferência em lote ({len(itens)} frames): {e}")
+                    for _, _, _, future in itens:
+                        future.set_exception(e)
+
+scheduler = InferenceScheduler(INFERENCE_MAX_BATCH, INFERENCE_MAX_WAIT_MS / 1000.0, workers=max(1, INFERENCE_PROCESSES))
+
 # --- Gerenciamento de Estado Global ---
-# Armazena o frame, a contagem de faces e o status de cada câmera.
-# Estrutura: { "url_camera": {"frame": frame, "face_count": int, "status": "running|error"} }
-cameras_data: Dict[str, Dict] = {}
-frames_lock = threading.Lock() # Lock para garantir a segurança das threads
+class CountSnapshot(NamedTuple):
+    """
+    Estado publicado de uma câmera. É imutável: cada atualização cria um novo snapshot.
+    """
+    face_count: int = 0
+    status: str = "connecting"
+    dropped_frames: int = 0
+    skipped_inferences: int = 0
+    tracks: Tuple[dict, ...] = ()
 
-# --- Processamento da Câmera ---
-def process_camera(source_url: str, conf: float = 0.5):
+class CameraState:
+    """
+    Estado de uma câmera no registro: worker, distribuidor MJPEG e o último snapshot.
+
+    Os leitores (endpoints de contagem, stream de eventos) apenas leem `snapshot`, sem
+    lock: a troca da referência é atômica e o snapshot nunca é alterado no lugar. O lock
+    próprio serializa somente os escritores da câmera (thread de processamento e mudanças
+    de estado vindas da captura), então câmeras diferentes nunca disputam o mesmo lock.
+    Os frames ficam no `FrameRing` do worker, com buffers e lock próprios.
+    """
+
+    __slots__ = ("url", "label", "worker", "broadcaster", "snapshot", "_lock")
+
+    def __init__(self, url: str, worker: Optional["CameraWorker"] = None):
+        self.url = url
+        self.label = camera_label(url)
+        self.worker = worker
+        self.broadcaster = MjpegBroadcaster()
+        self.snapshot = CountSnapshot()
+        self._lock = threading.Lock()
+
+    def update(self, **changes) -> CountSnapshot:
+        """
+        Publica um novo snapshot com os campos alterados e retorna o anterior.
+        """
+        with self._lock:
+            anterior = self.snapshot
+            self.snapshot = anterior._replace(**changes)
+        return anterior
+
+    @property
+    def alive(self) -> bool:
+        return self.worker is not None and self.worker.alive
+
+class CameraRegistry:
+    """
+    Registro das câmeras por URL, com cópia na escrita.
+
+    Inclusões e remoções (raras) montam um novo dicionário sob `lock`; leituras usam a
+    referência atual sem lock, então o custo de ler não cresce com câmeras e espectadores.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self._states: Dict[str, CameraState] = {}
+
+    def get(self, url: str) -> Optional[CameraState]:
+        return self._states.get(url)
+
+    def all(self) -> List[CameraState]:
+        return list(self._states.values())
+
+    def add(self, state: CameraState):
+        with self.lock:
+            states = dict(self._states)
+            states[state.url] = state
+            self._states = states
+
+    def remove(self, state: CameraState):
+        """
+        Remove a câmera, a menos que a URL já tenha sido registrada de novo por outro worker.
+        """
+        with self.lock:
+            if self._states.get(state.url) is state:
+                states = dict(self._states)
+                del states[state.url]
+                self._states = states
+
+camera_registry = CameraRegistry()
+
+# Histórico da contagem de faces por câmera (ring buffer em memória + log SQLite opcional)
+face_counts = CountStore(
+    capacity=int(os.getenv("FACE_COUNT_HISTORY_POINTS", "100000")),
+    sample_interval=float(os.getenv("FACE_COUNT_SAMPLE_INTERVAL", "1.0")),
+    db_path=os.getenv("FACE_COUNT_DB", ""),
+    retention_days=float(os.getenv("FACE_COUNT_DB_RETENTION_DAYS", "7")),
+)
+
+# --- Distribuição MJPEG ---
+# Tamanho da fila de cada espectador. Clientes lentos perdem os frames mais antigos
+# em vez de acumular memória ou atrasar os demais.
+MJPEG_VIEWER_QUEUE = int(os.getenv("MJPEG_VIEWER_QUEUE", "2"))
+
+def _offer_chunk(queue: asyncio.Queue, chunk: Optional[bytes]):
+    """
+    Entrega um chunk à fila de um espectador (executado no event loop do espectador).
+    Se a fila estiver cheia, descarta o chunk mais antigo. `None` sinaliza o fim do stream.
+    """
+    if chunk is None:
+        while not queue.empty():
+            queue.get_nowait()
+    elif queue.full():
+        queue.get_nowait()
+    queue.put_nowait(chunk)
+
+class MjpegBroadcaster:
     """
-    Captura e processa o stream de uma única câmera em uma thread separada.
+    Distribui o frame anotado de uma câmera para todos os espectadores de `/video/stream`.
+
+    Cada geração de frame é codificada em JPEG uma única vez, na thread da câmera, e o
+    mesmo chunk multipart é entregue à fila asyncio de cada espectador. Sem espectadores,
+    nada é codificado.
     """
-    cap = cv2.VideoCapture(source_url)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers: Dict[asyncio.Queue, asyncio.AbstractEventLoop] = {}
+        self.closed = False
+
+    @property
+    def viewers(self) -> int:
+        return len(self._subscribers)
+
+    def subscribe(self) -> asyncio.Queue:
+        """
+        Registra um espectador. Deve ser chamado de dentro do event loop.
+        """
+        queue = asyncio.Queue(maxsize=max(1, MJPEG_VIEWER_QUEUE))
+        with self._lock:
+            if self.closed:
+                queue.put_nowait(None)
+            else:
+                self._subscribers[queue] = asyncio.get_running_loop()
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        with self._lock:
+            self._subscribers.pop(queue, None)
+
+    def _dispatch(self, subscribers, chunk: Optional[bytes]):
+        for queue, loop in subscribers:
+            try:
+                loop.call_soon_threadsafe(_offer_chunk, queue, chunk)
+            except RuntimeError:
+                # Event loop já encerrado
+                self.unsubscribe(queue)
+
+    def publish(self, frame: np.ndarray):
+        """
+        Codifica o frame uma vez e o entrega a todos os espectadores conectados.
+        """
+        with self._lock:
+            subscribers = list(self._subscribers.items())
+        if not subscribers:
+            return
+        flag, encoded = cv2.imencode(".jpg", frame)
+        if not flag:
+            return
+        chunk = b'--frame\r\nContent-Type: image/jpeg\r\n\r\n' + encoded.tobytes() + b'\r\n'
+        self._dispatch(subscribers, chunk)
+
+    def close(self):
+        with self._lock:
+            self.closed = True
+            subscribers = list(self._subscribers.items())
+            self._subscribers.clear()
+        self._dispatch(subscribers, None)
+
+# --- Notificação de Contagens (Server-Sent Events) ---
+# Taxa máxima padrão de mensagens por assinante; mudanças dentro do intervalo são agrupadas
+COUNT_PUSH_MAX_RATE = float(os.getenv("COUNT_PUSH_MAX_RATE", "2"))
+# Intervalo (s) do comentário de keep-alive enviado quando não há mudanças
+COUNT_PUSH_KEEPALIVE = float(os.getenv("COUNT_PUSH_KEEPALIVE", "15"))
+
+class CountSubscription:
+    """
+    Assinatura de um cliente: guarda apenas o último estado de cada câmera desde o
+    último envio, então várias mudanças entre dois envios viram uma única mensagem.
+    """
+
+    def __init__(self, cameras: Optional[set], loop: asyncio.AbstractEventLoop):
+        self.cameras = cameras
+        self.loop = loop
+        self.pending: Dict[str, dict] = {}
+        self.changed = asyncio.Event()
+
+    def wants(self, url: str) -> bool:
+        return self.cameras is None or url in self.cameras
+
+    def offer(self, url: str, update: dict):
+        # Executado no event loop do assinante
+        self.pending[url] = update
+        self.changed.set()
+
+    def take(self) -> Dict[str, dict]:
+        self.changed.clear()
+        pending, self.pending = self.pending, {}
+        return pending
+
+class CountNotifier:
+    """
+    Distribui mudanças de contagem e de estado das câmeras para os assinantes de
+    `/faces_count/events`. As threads das câmeras só publicam quando algo muda.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions: List[CountSubscription] = []
+
+    def subscribe(self, cameras: Optional[set]) -> CountSubscription:
+        """
+        Registra um assinante. Deve ser chamado de dentro do event loop.
+        """
+        subscription = CountSubscription(cameras, asyncio.get_running_loop())
+        with self._lock:
+            self._subscriptions.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: CountSubscription):
+        with self._lock:
+            if subscription in self._subscriptions:
+                self._subscriptions.remove(subscription)
+
+    def publish(self, url: str, count: int, status: str):
+        with self._lock:
+            subscriptions = [s for s in self._subscriptions if s.wants(url)]
+        update = {"ip": url, "count": count, "status": status}
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.offer, url, update)
+            except RuntimeError:
+                # Event loop já encerrado
+                self.unsubscribe(subscription)
+
+count_notifier = CountNotifier()
+
+# --- Captura Desacoplada (Ring Buffer) ---
+CAPTURE_RING_SLOTS = int(os.getenv("CAPTURE_RING_SLOTS", "3"))
+
+class FrameRing:
+    """
+    Buffer circular pequeno e pré-alocado entre a thread de captura e a de inferência.
+
+    A captura escreve sempre em um slot diferente do último publicado, sem segurar o lock;
+    o consumidor copia apenas o frame mais recente. Frames publicados e nunca lidos são
+    descartados e contabilizados em `dropped`.
+    """
+
+    def __init__(self, slots: int = 3):
+        self._slots: List[Optional[np.ndarray]] = [None] * max(2, slots)
+        self._timestamps: List[float] = [0.0] * len(self._slots)
+        self._cond = threading.Condition()
+        self._latest = -1
+        self._seq = 0
+        self._read_seq = 0
+        self.dropped = 0
+        self.closed = False
+        # Instante de captura (time.monotonic) do último frame lido
+        self.read_timestamp = 0.0
+
+    def write_buffer(self) -> Tuple[int, Optional[np.ndarray]]:
+        """
+        Retorna o índice e o array do próximo slot livre para a captura escrever.
+        """
+        with self._cond:
+            idx = (self._latest + 1) % len(self._slots)
+            return idx, self._slots[idx]
+
+    def publish(self, idx: int, frame: np.ndarray, timestamp: float = 0.0):
+        """
+        Publica o slot `idx` como o frame mais recente, capturado em `timestamp`.
+        """
+        with self._cond:
+            # O OpenCV pode realocar o buffer se a resolução mudar
+            self._slots[idx] = frame
+            self._timestamps[idx] = timestamp
+            if self._seq > self._read_seq:
+                self.dropped += 1
+            self._latest = idx
+            self._seq += 1
+            self._cond.notify_all()
+
+    def read_latest(self, out: Optional[np.ndarray] = None, timeout: float = 1.0) -> Optional[np.ndarray]:
+        """
+        Copia o frame mais recente ainda não lido para `out` (reaproveitado quando possível).
+        Retorna None se nenhum frame novo chegar dentro de `timeout` ou se o buffer foi fechado.
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._seq > self._read_seq or self.closed, timeout):
+                return None
+            if self._seq <= self._read_seq:
+                return None
+            frame = self._slots[self._latest]
+            if out is None or out.shape != frame.shape or out.dtype != frame.dtype:
+                out = np.empty_like(frame)
+            np.copyto(out, frame)
+            self.read_timestamp = self._timestamps[self._latest]
+            self._read_seq = self._seq
+            return out
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+
+# --- Conexão e Reconexão ---
+# Timeout de abertura/leitura do stream e política de reconexão com backoff exponencial
+CAMERA_CONNECTION_TIMEOUT = float(os.getenv("CAMERA_CONNECTION_TIMEOUT", "10"))
+CAMERA_READ_FAILURES = int(os.getenv("CAMERA_READ_FAILURES", "5"))
+CAMERA_RECONNECT_BASE = float(os.getenv("CAMERA_RECONNECT_BASE", "1"))
+CAMERA_RECONNECT_MAX = float(os.getenv("CAMERA_RECONNECT_MAX", "30"))
+CAMERA_MAX_RETRIES = int(os.getenv("CAMERA_MAX_RETRIES", "10"))
+
+def open_capture(source_url: str):
+    """
+    Abre o stream com timeouts de conexão e leitura. Retorna None se não for possível abrir.
+    """
+    timeout_ms = int(CAMERA_CONNECTION_TIMEOUT * 1000)
+    source = int(source_url) if source_url.isdigit() else source_url
+    cap = cv2.VideoCapture(source, cv2.CAP_ANY, [
+        cv2.CAP_PROP_OPEN_TIMEOUT_MSEC, timeout_ms,
+        cv2.CAP_PROP_READ_TIMEOUT_MSEC, timeout_ms,
+    ])
     if not cap.isOpened():
-        print(f"[ERRO] Não foi possível abrir a câmera: {source_url}")
-        with frames_lock:
-            cameras_data[source_url] = {"frame": None, "face_count": 0, "status": "error"}
-        return
+        cap.release()
+        return None
+    # Reduz o buffer interno nos backends que suportam a propriedade
+    cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+    return cap
+
+
+def capture_loop(worker: "CameraWorker"):
+    """
+    Drena continuamente o `cv2.VideoCapture` para o ring buffer, evitando que frames
+    se acumulem no buffer interno do OpenCV enquanto a inferência está em andamento.
+
+    Falhas de leitura isoladas são toleradas sem fechar o VideoCapture (até
+    `CAMERA_READ_FAILURES` seguidas). Depois disso, ou se a abertura falhar, o stream é
+    reaberto com backoff exponencial, até `CAMERA_MAX_RETRIES` tentativas seguidas (0 = sem limite).
+    Em pausa, os frames são apenas descartados com `grab()`, mantendo a sessão aberta.
+    """
+    source_url, ring = worker.url, worker.ring
+    label = camera_label(source_url)
+    cap = None
+    tentativas = 0
+    falhas = 0
+    try:
+        while not worker.stopped:
+            if cap is None:
+                cap = open_capture(source_url)
+                if cap is None:
+                    tentativas += 1
+                    if CAMERA_MAX_RETRIES and tentativas > CAMERA_MAX_RETRIES:
+                        print(f"[ERRO] Não foi possível abrir a câmera: {source_url}")
+                        worker.set_state("error")
+                        break
+                    atraso = min(CAMERA_RECONNECT_MAX, CAMERA_RECONNECT_BASE * 2 ** (tentativas - 1))
+                    print(f"[INFO] Câmera {source_url} indisponível; nova tentativa em {atraso:.1f}s.")
+                    worker.set_state("reconnecting" if worker.reconnects else "connecting")
+                    worker.wait(atraso)
+                    continue
+                tentativas = falhas = 0
+                worker.set_state("paused" if worker.paused else "running")
+
+            # grab() lê o pacote do stream; retrieve() decodifica. Em pausa, nada é decodificado.
+            inicio = time.perf_counter()
+            ok, frame = cap.grab(), None
+            capturado = time.monotonic()
+            M_CAPTURE.observe(time.perf_counter() - inicio, label)
+            if ok and not worker.paused:
+                idx, buf = ring.write_buffer()
+                inicio = time.perf_counter()
+                ok, frame = cap.retrieve(buf)
+                M_DECODE.observe(time.perf_counter() - inicio, label)
+            if ok:
+                falhas = 0
+                if frame is not None:
+                    ring.publish(idx, frame, capturado)
+                continue
+
+            falhas += 1
+            if falhas < CAMERA_READ_FAILURES:
+                # Falha transitória: mantém o VideoCapture aberto e tenta ler novamente
+                worker.wait(0.1 * falhas)
+                continue
+            print(f"[INFO] Stream da câmera {source_url} terminou ou foi perdido; reconectando.")
+            cap.release()
+            cap = None
+            worker.reconnects += 1
+            worker.set_state("reconnecting")
+    except Exception as e:
+        print(f"[ERRO] Erro na captura da câmera {source_url}: {e}")
+        worker.set_state("error")
+    finally:
+        ring.close()
+        if cap is not None:
+            cap.release()
+
+
+# --- Modo Adaptativo (Portão de Movimento) ---
+class MotionGate:
+    """
+    Decide se um frame precisa passar pelo modelo.
+
+    Compara uma miniatura em tons de cinza do frame com a do último keyframe (o último
+    frame em que o modelo rodou). O modelo só é executado quando a diferença média
+    ultrapassa `threshold` ou quando `keyframe_interval` frames se passaram sem inferência.
+    """
+
+    THUMB_SIZE = (64, 36)
+
+    def __init__(self, threshold: float, keyframe_interval: int):
+        self.threshold = threshold
+        self.keyframe_interval = max(1, keyframe_interval)
+        self.motion = 0.0
+        self.skipped = 0
+        self._reference = None
+        self._since_keyframe = 0
+
+    def should_detect(self, frame: np.ndarray) -> bool:
+        thumb = cv2.cvtColor(cv2.resize(frame, self.THUMB_SIZE, interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY)
+        self._since_keyframe += 1
+        if self._reference is not None:
+            self.motion = cv2.mean(cv2.absdiff(thumb, self._reference))[0]
+            if self.motion < self.threshold and self._since_keyframe < self.keyframe_interval:
+                self.skipped += 1
+                return False
+        self._reference = thumb
+        self._since_keyframe = 0
+        return True
+
+
+# --- Pré-processamento por Câmera ---
+class FramePreprocessor:
+    """
+    Prepara o frame de uma câmera para a inferência: recorta a região de interesse (ROI)
+    e reduz o recorte para que o maior lado tenha `imgsz` pixels, em um buffer
+    pré-alocado e reutilizado a cada frame. Assim o modelo recebe uma imagem já no
+    tamanho de inferência, em vez de redimensionar o frame 1080p/4K inteiro.
+
+    `roi` é (x1, y1, x2, y2) em frações da largura e da altura (0 a 1). `restore` converte
+    as caixas da última chamada a `prepare` para coordenadas do frame original.
+    """
+
+    def __init__(self, imgsz: Optional[int] = None, roi: Optional[Tuple[float, float, float, float]] = None):
+        # O modelo trabalha com múltiplos do stride (32)
+        self.imgsz = int(np.ceil(imgsz / 32) * 32) if imgsz else None
+        self.roi = tuple(roi) if roi else None
+        self._shape = None
+        self._janela = None
+        self._buffer: Optional[np.ndarray] = None
+        self._escala = 1.0
+
+    def _configurar(self, shape):
+        h, w = shape[:2]
+        if self.roi:
+            x1, y1, x2, y2 = self.roi
+            x1, x2 = int(x1 * w), max(int(x1 * w) + 1, int(x2 * w))
+            y1, y2 = int(y1 * h), max(int(y1 * h) + 1, int(y2 * h))
+        else:
+            x1, y1, x2, y2 = 0, 0, w, h
+        self._janela = (x1, y1, x2, y2)
+        self._shape = shape
+
+        largura, altura = x2 - x1, y2 - y1
+        self._escala = 1.0
+        self._buffer = None
+        if self.imgsz and max(largura, altura) > self.imgsz:
+            self._escala = max(largura, altura) / self.imgsz
+            tamanho = (max(1, round(altura / self._escala)), max(1, round(largura / self._escala)), shape[2])
+            self._buffer = np.empty(tamanho, dtype=np.uint8)
+
+    def crop(self, frame: np.ndarray) -> np.ndarray:
+        """
+        Retorna a ROI do frame como view (sem cópia).
+        """
+        if frame.shape != self._shape:
+            self._configurar(frame.shape)
+        x1, y1, x2, y2 = self._janela
+        return frame[y1:y2, x1:x2]
+
+    def prepare(self, frame: np.ndarray) -> np.ndarray:
+        recorte = self.crop(frame)
+        if self._buffer is None:
+            return recorte
+        altura, largura = self._buffer.shape[:2]
+        return cv2.resize(recorte, (largura, altura), dst=self._buffer, interpolation=cv2.INTER_AREA)
+
+    def restore(self, boxes: np.ndarray) -> np.ndarray:
+        x1, y1, _, _ = self._janela
+        if self._escala == 1.0 and x1 == 0 and y1 == 0:
+            return boxes
+        boxes = boxes.copy()
+        boxes[:, :4] *= self._escala
+        boxes[:, [0, 2]] += x1
+        boxes[:, [1, 3]] += y1
+        return boxes
+
+    def draw_roi(self, frame: np.ndarray):
+        if self.roi and self._janela:
+            x1, y1, x2, y2 = self._janela
+            cv2.rectangle(frame, (x1, y1), (x2 - 1, y2 - 1), (255, 160, 0), 1)
+
+
+def draw_detections(frame: np.ndarray, boxes: np.ndarray, num_faces: int, show_ids: bool = False) -> np.ndarray:
+    """
+    Desenha as caixas e o contador de rostos diretamente sobre o frame.
+    Com `show_ids`, a última coluna de `boxes` é o ID do rastro em vez da classe.
+    """
+    for x1, y1, x2, y2, score, extra in boxes:
+        p1, p2 = (int(x1), int(y1)), (int(x2), int(y2))
+        label = f"#{int(extra)}" if show_ids else f"{score:.2f}"
+        cv2.rectangle(frame, p1, p2, (0, 255, 0), 2)
+        cv2.putText(frame, label, (p1[0], max(p1[1] - 5, 15)), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
+    cv2.putText(frame, f"Rostos: {num_faces}", (20, 40), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
+    return frame
+
+
+# --- Processamento da Câmera ---
+def process_camera(worker: "CameraWorker"):
+    """
+    Processa o stream de uma única câmera em uma thread separada.
+    A leitura do stream é feita por uma thread de captura dedicada (ver `capture_loop`).
+    No modo adaptativo, frames sem movimento reutilizam as últimas detecções e a taxa
+    de processamento cai para `idle_fps` enquanto a cena estiver vazia e parada.
+    Com rastreamento, o detector roda a cada `detect_interval` frames e as caixas são
+    propagadas pelo `IoUTracker` nos frames intermediários, com IDs estáveis por face.
+    Câmeras sem espectadores no stream de vídeo apenas contam faces: nenhum frame é
+    anotado, copiado ou codificado.
+    """
+    req, ring, camera = worker.req, worker.ring, worker.camera
+    source_url, conf, label = req.url, req.conf, camera.label
+    broadcaster = camera.broadcaster
+    ultimo_frame = None
+    threading.Thread(target=capture_loop, args=(worker,), name=f"capture-{source_url}", daemon=True).start()
+    buffer = None
+    gate = MotionGate(req.motion_threshold, req.keyframe_interval) if req.adaptive else None
+    preprocessor = FramePreprocessor(req.imgsz, req.roi)
+    tracker = IoUTracker() if req.tracking else None
+    boxes = np.empty((0, 6), dtype=np.float32)
+    desde_deteccao = req.detect_interval
+    ultima_contagem = None
+    # A série da câmera é resolvida uma vez: cada frame só usa o lock da própria série
+    registrar_contagem = face_counts.recorder(label)
 
     while True:
+        inicio = time.monotonic()
         try:
-            ret, frame = cap.read()
-            if not ret:
-                print(f"[INFO] Stream da câmera {source_url} terminou ou foi perdido.")
-                break
+            frame = ring.read_latest(buffer)
+            if frame is None:
+                if ring.closed:
+                    break
+                continue
+            buffer = frame
 
             # Verifica se o modelo está carregado antes de fazer a predição
             if modelo is None:
                 print(f"[ERRO] Modelo não disponível para processamento da câmera: {source_url}")
-                with frames_lock:
-                    cameras_data[source_url] = {"frame": None, "face_count": 0, "status": "error"}
-                return
-                
-            # A predição é feita aqui
-            resultados = modelo.predict(source=frame, conf=conf, device=device, verbose=False)
-            
-            # Pega o primeiro resultado (geralmente só há um por imagem)
-            resultado = resultados[0]
-            
+                worker.set_state("error")
+                break
+
+            # A predição é feita pelo agendador, em lote com as demais câmeras.
+            # Com rastreamento, o detector só roda a cada `detect_interval` frames; no modo
+            # adaptativo, frames sem movimento reaproveitam as últimas detecções.
+            detectar = True
+            if tracker is not None and desde_deteccao < req.detect_interval:
+                detectar = False
+            elif gate is not None:
+                detectar = gate.should_detect(preprocessor.crop(frame))
+
+            if detectar:
+                inicio_inferencia = time.perf_counter()
+                try:
+                    entrada = preprocessor.prepare(frame)
+                    boxes = preprocessor.restore(scheduler.submit(source_url, entrada, conf, preprocessor.imgsz).result())
+                except CancelledError:
+                    continue
+                M_INFERENCE.observe(time.perf_counter() - inicio_inferencia, label)
+                desde_deteccao = 0
+                if tracker is not None:
+                    tracker.update(boxes)
+            elif tracker is not None:
+                tracker.predict()
+            desde_deteccao += 1
+
             # A contagem de faces já é obtida aqui
-            num_faces = len(resultado.boxes)
-            
-            # Desenha as detecções no frame
-            frame_processado = resultado.plot()
-            cv2.putText(frame_processado, f"Rostos: {num_faces}", (20, 40), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
-
-            # Atualiza o dicionário global com o frame e a contagem de faces
-            with frames_lock:
-                cameras_data[source_url] = {
-                    "frame": frame_processado.copy(),
-                    "face_count": num_faces,
-                    "status": "running"
-                }
+            num_faces = tracker.count() if tracker is not None else len(boxes)
+
+            # Anotação preguiçosa: o frame só é desenhado e codificado se houver espectadores
+            # em /video/stream. O desenho é feito sobre o buffer de leitura, sem cópia; ele só
+            # é reescrito na próxima iteração, depois de o JPEG já ter sido gerado.
+            if broadcaster.viewers:
+                inicio_render = time.perf_counter()
+                boxes_desenho = tracker.boxes() if tracker is not None else boxes
+                preprocessor.draw_roi(frame)
+                broadcaster.publish(draw_detections(frame, boxes_desenho, num_faces, show_ids=tracker is not None))
+                M_RENDER.observe(time.perf_counter() - inicio_render, label)
+
+            # Publica a contagem de faces (novo snapshot, sem lock global)
+            camera.update(
+                face_count=num_faces,
+                dropped_frames=ring.dropped,
+                skipped_inferences=gate.skipped if gate else 0,
+                tracks=tuple(
+                    {"id": t.id, "dwell_seconds": round(t.dwell_seconds, 1)}
+                    for t in tracker.confirmed()
+                ) if tracker else (),
+            )
+
+            registrar_contagem(num_faces)
+            if num_faces != ultima_contagem:
+                count_notifier.publish(source_url, num_faces, worker.state)
+                ultima_contagem = num_faces
+
+            agora = time.monotonic()
+            M_FRAME_AGE.observe(agora - ring.read_timestamp, label)
+            if ultimo_frame is not None and agora > ultimo_frame:
+                M_FPS.set(1.0 / (agora - ultimo_frame), label)
+            ultimo_frame = agora
+            if gate is not None:
+                M_SKIPPED.set(gate.skipped, label)
 
         except Exception as e:
             print(f"[ERRO] Erro no loop de processamento para {source_url}: {e}")
             break
-        
-        # Pequena pausa para não sobrecarregar a CPU
-        time.sleep(0.05)
-
-    cap.release()
-    with frames_lock:
-        # Marca a câmera como inativa ou com erro
-        cameras_data.pop(source_url, None) # Remove a câmera da lista ativa
+
+        # Limita a taxa de processamento; cenas vazias e paradas usam a taxa ociosa
+        ocioso = gate is not None and num_faces == 0 and gate.motion < req.motion_threshold
+        intervalo = 1.0 / (req.idle_fps if ocioso else req.max_fps)
+        time.sleep(max(0.0, intervalo - (time.monotonic() - inicio)))
+
+    worker.stop()
+    broadcaster.close()
+    count_notifier.publish(source_url, 0, worker.state)
+    # Remove a câmera do registro; câmeras com erro permanecem visíveis com status "error"
+    if worker.state != "error":
+        camera_registry.remove(camera)
+    for metrica in CAMERA_METRICS:
+        metrica.remove(label)
     print(f"[INFO] Thread da câmera {source_url} finalizada.")
 
 
+# --- Supervisor de Câmeras ---
+MAX_CAMERAS = int(os.getenv("MAX_CAMERAS", "32"))
+
+class CameraWorker:
+    """
+    Ciclo de vida de uma câmera: threads de captura e de processamento, pausa e parada.
+
+    Estados: connecting, running, paused, reconnecting, error e stopped.
+    """
+
+    def __init__(self, req: "CameraRequest"):
+        self.req = req
+        self.url = req.url
+        self.state = "connecting"
+        self.reconnects = 0
+        self.started_at = time.time()
+        self.ring = FrameRing(CAPTURE_RING_SLOTS)
+        self._stop = threading.Event()
+        self._paused = False
+        self.camera = CameraState(self.url, self)
+        self.thread = threading.Thread(target=process_camera, args=(self,), name=f"camera-{self.url}", daemon=True)
+
+    @property
+    def stopped(self) -> bool:
+        return self._stop.is_set()
+
+    @property
+    def paused(self) -> bool:
+        return self._paused
+
+    @property
+    def alive(self) -> bool:
+        return self.thread.is_alive()
+
+    def wait(self, seconds: float):
+        """
+        Aguarda `seconds`, retornando antes se a câmera for parada.
+        """
+        self._stop.wait(seconds)
+
+    def set_state(self, state: str):
+        self.state = state
+        anterior = self.camera.update(status=state)
+        if anterior.status != state:
+            count_notifier.publish(self.url, anterior.face_count, state)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        if not self.stopped:
+            self._stop.set()
+            self.ring.close()
+            if self.state != "error":
+                self.state = "stopped"
+
+    def pause(self):
+        self._paused = True
+        self.set_state("paused")
+
+    def resume(self):
+        self._paused = False
+        if self.state == "paused":
+            self.set_state("running")
+
+    def info(self) -> dict:
+        return {
+            "url": self.url,
+            "state": self.state,
+            "reconnects": self.reconnects,
+            "dropped_frames": self.ring.dropped,
+            "uptime_seconds": round(time.time() - self.started_at, 1),
+        }
+
+def launch_camera(req: "CameraRequest") -> str:
+    """
+    Inicia o worker de uma câmera. Retorna "started", "already_running" ou "limit_reached".
+    """
+    with camera_registry.lock:
+        atual = camera_registry.get(req.url)
+        if atual is not None and atual.alive:
+            return "already_running"
+        if sum(1 for c in camera_registry.all() if c.alive) >= MAX_CAMERAS:
+            return "limit_reached"
+        worker = CameraWorker(req)
+        camera_registry.add(worker.camera)
+    worker.start()
+    return "started"
+
+def get_worker(url: str) -> CameraWorker:
+    camera = camera_registry.get(url)
+    if camera is None or not camera.alive:
+        raise HTTPException(status_code=404, detail="Câmera não encontrada ou já finalizada.")
+    return camera.worker
+
+
 # --- Autenticação JWT ---
 load_dotenv()
 SECRET_KEY = os.getenv("SECRET_KEY", "SUA_SECRET_KEY_PADRAO_SE_NAO_DEFINIDA")
+# Validade (s) do ticket do stream de contagem; só é verificado ao abrir a conexão
+SSE_TICKET_TTL = int(os.getenv("SSE_TICKET_TTL", "60"))
+SSE_TICKET_SCOPE = "faces_count_events"
+
+class RedactQueryTokens(logging.Filter):
+    """
+    Mascara `token=` e `ticket=` da query string nas linhas do access log
+    (/ws/usb e /faces_count/events recebem a credencial na URL).
+    """
+    PATTERN = re.compile(r"([?&](?:token|ticket)=)[^&\s\"]+")
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if isinstance(record.args, tuple):
+            record.args = tuple(self.PATTERN.sub(r"\1***", a) if isinstance(a, str) else a for a in record.args)
+        elif isinstance(record.args, dict):
+            record.args = {k: self.PATTERN.sub(r"\1***", v) if isinstance(v, str) else v for k, v in record.args.items()}
+        return True
+
+for _logger in ("uvicorn.access", "gunicorn.access"):
+    logging.getLogger(_logger).addFilter(RedactQueryTokens())
 
 def verify_jwt(request: Request):
     """
@@ -156,6 +1011,16 @@ def verify_jwt(request: Request):
         raise HTTPException(status_code=401, detail="Token de autorização ausente ou mal formatado")
     
     token = auth.split(" ")[1]
+    payload = decode_token(token)
+    if payload.get("scope") == SSE_TICKET_SCOPE:
+        # Tickets do SSE trafegam na URL: não valem como credencial para o resto da API
+        raise HTTPException(status_code=401, detail="Token inválido")
+    return payload
+
+def decode_token(token: str):
+    """
+    Decodifica e valida um token JWT, levantando 401 se for inválido ou expirado.
+    """
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
         return payload
@@ -168,10 +1033,31 @@ def verify_jwt(request: Request):
 class CameraRequest(BaseModel):
     url: str
     conf: float = 0.5
+    # Taxa máxima de processamento (frames por segundo)
+    max_fps: float = Field(20.0, gt=0)
+    # Modo adaptativo: pula a inferência em frames sem movimento
+    adaptive: bool = False
+    # Diferença média de intensidade (0-255) entre miniaturas que dispara uma nova inferência
+    motion_threshold: float = Field(4.0, ge=0)
+    # Força uma inferência a cada N frames, mesmo sem movimento
+    keyframe_interval: int = Field(30, ge=1)
+    # Taxa usada quando a cena está vazia e parada (somente no modo adaptativo)
+    idle_fps: float = Field(5.0, gt=0)
+    # Rastreamento: propaga as caixas entre detecções e atribui IDs estáveis às faces
+    tracking: bool = False
+    # Com rastreamento, executa o detector a cada N frames
+    detect_interval: int = Field(3, ge=1)
+    # Tamanho de inferência (lado maior, em pixels); None usa o padrão do modelo (640)
+    imgsz: Optional[int] = Field(None, ge=64, le=1920)
+    # Região de interesse (x1, y1, x2, y2) em frações do frame; só ela é analisada
+    roi: Optional[Tuple[float, float, float, float]] = None
 
 class StartCamerasRequest(BaseModel):
     camera_ips: List[str]
 
+class CameraControlRequest(BaseModel):
+    url: str
+
 # --- Endpoints da API ---
 
 @app.get("/", summary="Verifica o Status da API")
@@ -186,27 +1072,54 @@ def health_check():
     """
     if modelo is None:
         return {"status": "unhealthy", "message": "Modelo não foi carregado corretamente"}
+    if not modelo.healthy:
+        return {"status": "unhealthy", "message": "Workers de inferência falharam ao carregar o modelo", "backend": modelo.name}
     
     return {
         "status": "healthy",
         "message": "API está funcionando corretamente",
         "device": device,
+        "backend": modelo.name,
         "model_loaded": True
     }
 
+@app.get("/metrics", summary="Métricas do pipeline no formato Prometheus", response_class=PlainTextResponse)
+def metrics_endpoint():
+    """
+    Exporta histogramas por etapa do pipeline e contadores por câmera.
+    As URLs das câmeras aparecem sem credenciais no rótulo `camera`.
+    """
+    for camera in camera_registry.all():
+        if not camera.alive:
+            continue
+        M_DROPPED.set(camera.worker.ring.dropped, camera.label)
+        M_RECONNECTS.set(camera.worker.reconnects, camera.label)
+        M_VIEWERS.set(camera.broadcaster.viewers, camera.label)
+    M_QUEUE.set(scheduler.queue_depth)
+    M_USB_IN_FLIGHT.set(usb_admission.in_flight)
+    M_USB_REJECTED.set(usb_admission.rejected)
+
+    return PlainTextResponse(
+        metrics.render(CAMERA_METRICS + (M_BATCH_SIZE, M_BATCH_SECONDS, M_QUEUE, M_USB, M_USB_IN_FLIGHT, M_USB_REJECTED)),
+        media_type="text/plain; version=0.0.4",
+    )
+
 @app.post("/start_camera/", summary="Inicia a detecção em uma nova câmera", dependencies=[Depends(verify_jwt)])
 def start_camera(req: CameraRequest):
     """
     Inicia uma nova thread para processar uma câmera se ela ainda não estiver ativa.
     """
     print(f"[API] Recebida solicitação para iniciar câmera: {req.url}")
-    with frames_lock:
-        if req.url in cameras_data and cameras_data[req.url].get("status") == "running":
-            raise HTTPException(status_code=400, detail="A detecção para esta câmera já está em execução.")
+    if req.roi:
+        x1, y1, x2, y2 = req.roi
+        if not (0 <= x1 < x2 <= 1 and 0 <= y1 < y2 <= 1):
+            raise HTTPException(status_code=400, detail="`roi` deve ser (x1, y1, x2, y2) com 0 <= x1 < x2 <= 1 e 0 <= y1 < y2 <= 1.")
+    resultado = launch_camera(req)
+    if resultado == "already_running":
+        raise HTTPException(status_code=400, detail="A detecção para esta câmera já está em execução.")
+    if resultado == "limit_reached":
+        raise HTTPException(status_code=429, detail=f"Limite de {MAX_CAMERAS} câmeras simultâneas atingido.")
 
-    t = threading.Thread(target=process_camera, args=(req.url, req.conf), daemon=True)
-    t.start()
-    
     # Codifica a URL da câmera para ser usada na URL do stream
     encoded_url = urllib.parse.quote_plus(req.url)
     
@@ -225,46 +1138,76 @@ def start_cameras(req: StartCamerasRequest):
     """
     started = []
     already_running = []
+    rejected = []
     for ip in req.camera_ips:
-        with frames_lock:
-            if ip in cameras_data and cameras_data[ip].get("status") == "running":
-                already_running.append(ip)
-                continue
-        t = threading.Thread(target=process_camera, args=(ip, 0.5), daemon=True)
-        t.start()
-        started.append(ip)
+        resultado = launch_camera(CameraRequest(url=ip))
+        if resultado == "started":
+            started.append(ip)
+        elif resultado == "already_running":
+            already_running.append(ip)
+        else:
+            rejected.append(ip)
     return {
         "started": started,
         "already_running": already_running,
-        "message": f"{len(started)} câmeras iniciadas, {len(already_running)} já estavam em execução."
+        "rejected": rejected,
+        "message": f"{len(started)} câmeras iniciadas, {len(already_running)} já estavam em execução, "
+                   f"{len(rejected)} recusadas pelo limite de {MAX_CAMERAS} câmeras."
     }
 
+@app.post("/stop_camera/", summary="Encerra a detecção em uma câmera", dependencies=[Depends(verify_jwt)])
+def stop_camera(req: CameraControlRequest):
+    """
+    Para as threads de captura e processamento da câmera e libera o stream.
+    """
+    get_worker(req.url).stop()
+    return {"status": "stopping", "camera_url": req.url}
+
+@app.post("/pause_camera/", summary="Pausa a detecção em uma câmera", dependencies=[Depends(verify_jwt)])
+def pause_camera(req: CameraControlRequest):
+    """
+    Suspende a inferência mantendo a conexão com a câmera aberta.
+    """
+    worker = get_worker(req.url)
+    worker.pause()
+    return {"status": worker.state, "camera_url": req.url}
+
+@app.post("/resume_camera/", summary="Retoma a detecção em uma câmera pausada", dependencies=[Depends(verify_jwt)])
+def resume_camera(req: CameraControlRequest):
+    worker = get_worker(req.url)
+    worker.resume()
+    return {"status": worker.state, "camera_url": req.url}
+
+@app.get("/cameras", summary="Lista as câmeras supervisionadas", dependencies=[Depends(verify_jwt)])
+def list_cameras():
+    return {"max_cameras": MAX_CAMERAS, "cameras": [c.worker.info() for c in camera_registry.all() if c.alive]}
+
 @app.get("/video/stream", summary="Fornece o stream de vídeo de uma câmera")
-def video_stream(camera_url: str = Query(...)):
+async def video_stream(camera_url: str = Query(...)):
     """
     Gera um stream de vídeo multipart para a câmera especificada.
     Usa a URL da câmera como identificador único.
+    O gerador é assíncrono e não ocupa uma thread do threadpool enquanto o stream está aberto.
     """
     decoded_url = urllib.parse.unquote_plus(camera_url)
 
-    def gen():
-        while True:
-            with frames_lock:
-                cam_data = cameras_data.get(decoded_url)
-
-            if not cam_data or cam_data["frame"] is None:
-                # Se a câmera não for encontrada ou o frame for nulo, encerra o stream.
-                break
+    camera = camera_registry.get(decoded_url)
+    broadcaster = camera.broadcaster if camera is not None else None
 
-            # Codifica o frame para JPEG
-            (flag, encodedImage) = cv2.imencode(".jpg", cam_data["frame"])
-            if not flag:
-                continue
-
-            # Produz o frame para o stream
-            yield (b'--frame\r\n'
-                   b'Content-Type: image/jpeg\r\n\r\n' + bytearray(encodedImage) + b'\r\n')
-            time.sleep(0.1) # Limita a taxa de frames
+    async def gen():
+        if broadcaster is None:
+            # Se a câmera não for encontrada, encerra o stream.
+            return
+        queue = broadcaster.subscribe()
+        try:
+            while True:
+                # Aguarda o próximo frame já codificado pela thread da câmera
+                chunk = await queue.get()
+                if chunk is None:
+                    break
+                yield chunk
+        finally:
+            broadcaster.unsubscribe(queue)
 
     return StreamingResponse(gen(), media_type="multipart/x-mixed-replace; boundary=frame")
 
@@ -272,52 +1215,342 @@ def video_stream(camera_url: str = Query(...)):
 def faces_count(ip: str = Query(..., alias="camera_url")):
     """
     Retorna a contagem de faces para uma câmera específica de forma eficiente.
-    Não reprocessa a imagem, apenas lê o valor salvo.
+    Não reprocessa a imagem, apenas lê o último snapshot publicado, sem lock.
     """
-    with frames_lock:
-        cam_data = cameras_data.get(ip)
-    
-    if not cam_data:
+    camera = camera_registry.get(ip)
+    if camera is None:
         return {"ip": ip, "count": 0, "status": "not_found"}
-    
-    return {"ip": ip, "count": cam_data["face_count"], "status": cam_data["status"]}
 
+    snapshot = camera.snapshot
+    return {
+        "ip": ip,
+        "count": snapshot.face_count,
+        "status": snapshot.status,
+        "dropped_frames": snapshot.dropped_frames,
+        "skipped_inferences": snapshot.skipped_inferences,
+        "tracks": list(snapshot.tracks)
+    }
+
+@app.get("/faces_count/history", summary="Histórico agregado da contagem de faces", dependencies=[Depends(verify_jwt)])
+def faces_count_history(
+    camera_url: Optional[str] = Query(None, description="Câmera; sem ela, retorna todas as câmeras"),
+    start: Optional[float] = Query(None, description="Início da janela (epoch em segundos); padrão: 1 hora atrás"),
+    end: Optional[float] = Query(None, description="Fim da janela (epoch em segundos); padrão: agora"),
+    step: Optional[float] = Query(None, gt=0, description="Tamanho de cada ponto em segundos"),
+    points: int = Query(300, ge=1, le=5000, description="Número de pontos quando `step` não é informado"),
+):
+    """
+    Retorna a contagem de faces em janelas de `step` segundos com mínimo, máximo e média,
+    para montar um gráfico inteiro em uma única requisição.
+    """
+    end = time.time() if end is None else end
+    start = end - 3600 if start is None else start
+    if end <= start:
+        raise HTTPException(status_code=400, detail="`end` deve ser maior que `start`.")
+    step = step or (end - start) / points
+    if (end - start) / step > 5000:
+        raise HTTPException(status_code=400, detail="Janela com pontos demais; aumente `step`.")
+
+    labels = [camera_label(camera_url)] if camera_url else face_counts.cameras()
+    return {
+        "start": start,
+        "end": end,
+        "step": step,
+        "cameras": [{"camera": c, "points": face_counts.query(c, start, end, step)} for c in labels],
+    }
+
+@app.post("/faces_count/events/ticket", summary="Gera um ticket de curta duração para o stream de contagem")
+def faces_count_events_ticket(payload: dict = Depends(verify_jwt)):
+    """
+    O `EventSource` não envia cabeçalhos, então a credencial do stream vai na URL e acaba
+    em logs de proxies. Em vez do JWT da sessão, o cliente envia este ticket, que só vale
+    para `/faces_count/events` e expira em `SSE_TICKET_TTL` segundos.
+    """
+    ticket = jwt.encode(
+        {"sub": payload.get("sub"), "scope": SSE_TICKET_SCOPE, "exp": int(time.time()) + SSE_TICKET_TTL},
+        SECRET_KEY,
+        algorithm="HS256",
+    )
+    return {"ticket": ticket, "expires_in": SSE_TICKET_TTL}
+
+@app.get("/faces_count/events", summary="Stream (SSE) de mudanças na contagem de faces")
+async def faces_count_events(
+    request: Request,
+    camera_url: Optional[List[str]] = Query(None, description="Câmeras assinadas; sem elas, todas"),
+    ticket: Optional[str] = Query(None, description="Ticket de /faces_count/events/ticket (EventSource não permite cabeçalhos)"),
+    max_rate: float = Query(COUNT_PUSH_MAX_RATE, gt=0, le=50, description="Mensagens por segundo, no máximo"),
+):
+    """
+    Envia, via Server-Sent Events, a contagem e o estado das câmeras assinadas sempre que
+    mudam, em vez de o cliente consultar `/faces_count` periodicamente.
+
+    A primeira mensagem traz o estado atual; as seguintes trazem só as câmeras que mudaram.
+    Mudanças mais rápidas que `max_rate` são agrupadas, prevalecendo o valor mais recente.
+    """
+    if request.headers.get("Authorization", "").startswith("Bearer "):
+        verify_jwt(request)
+    elif decode_token(ticket or "").get("scope") != SSE_TICKET_SCOPE:
+        raise HTTPException(status_code=401, detail="Ticket inválido")
+
+    cameras = set(camera_url) if camera_url else None
+    subscription = count_notifier.subscribe(cameras)
+    inicial = [
+        {"ip": c.url, "count": c.snapshot.face_count, "status": c.snapshot.status}
+        for c in camera_registry.all()
+        if subscription.wants(c.url)
+    ]
+
+    def evento(updates: list) -> str:
+        return f"event: counts\ndata: {json.dumps(updates)}\n\n"
+
+    async def gen():
+        try:
+            yield evento(inicial)
+            while True:
+                try:
+                    await asyncio.wait_for(subscription.changed.wait(), COUNT_PUSH_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield evento(list(subscription.take().values()))
+                await asyncio.sleep(1.0 / max_rate)
+        finally:
+            count_notifier.unsubscribe(subscription)
+
+    return StreamingResponse(gen(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+# --- Processamento de Frames USB ---
+USB_BATCH_MAX_FRAMES = int(os.getenv("USB_BATCH_MAX_FRAMES", "16"))
+# cv2.imdecode libera o GIL, então a decodificação paraleliza em threads
+decode_executor = ThreadPoolExecutor(max_workers=int(os.getenv("DECODE_WORKERS", "4")), thread_name_prefix="decode")
+
+def decode_frame(contents: bytes) -> Optional[np.ndarray]:
+    """
+    Decodifica um JPEG/PNG recebido em um array BGR. Retorna None se a imagem for inválida.
+    """
+    return cv2.imdecode(np.frombuffer(contents, np.uint8), cv2.IMREAD_COLOR)
+
+# Controle de admissão: limita os frames USB aguardando decodificação/inferência.
+# Acima do limite a requisição é recusada imediatamente em vez de acumular latência.
+USB_MAX_PENDING = int(os.getenv("USB_MAX_PENDING", "32"))
+
+class AdmissionControl:
+    """
+    Contador de frames em processamento com limite fixo.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = max(1, limit)
+        self.in_flight = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def try_acquire(self, n: int = 1) -> bool:
+        with self._lock:
+            if self.in_flight + n > self.limit:
+                self.rejected += 1
+                return False
+            self.in_flight += n
+            return True
+
+    def release(self, n: int = 1):
+        with self._lock:
+            self.in_flight -= n
+
+usb_admission = AdmissionControl(USB_MAX_PENDING)
+
+def reject_overload():
+    raise HTTPException(
+        status_code=503,
+        detail="Fila de inferência cheia, tente novamente",
+        headers={"Retry-After": "1"},
+    )
+
+def boxes_to_list(boxes: np.ndarray) -> List[List[float]]:
+    """
+    Converte as caixas (N, 6) em listas [x1, y1, x2, y2, conf] serializáveis.
+    """
+    return [[round(float(v), 2) for v in box[:5]] for box in boxes]
 
 @app.post("/process_usb_frame/", summary="Processa um frame de câmera USB", dependencies=[Depends(verify_jwt)])
 async def process_usb_frame(frame: UploadFile = File(...)):
     """
     Recebe um frame da câmera USB, processa para detecção facial e retorna o resultado.
+    A decodificação roda no executor e a inferência no agendador compartilhado, sem
+    bloquear o event loop. Com a fila cheia, responde 503 imediatamente.
     """
+    # Verifica se o modelo está carregado
+    if modelo is None:
+        raise HTTPException(status_code=503, detail="Modelo não está disponível no momento")
+    if not usb_admission.try_acquire():
+        reject_overload()
+
+    inicio = time.perf_counter()
     try:
         contents = await frame.read()
 
-        # Converte para formato numpy
-        nparr = np.frombuffer(contents, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        # Converte para formato numpy fora do event loop
+        loop = asyncio.get_running_loop()
+        img = await loop.run_in_executor(decode_executor, decode_frame, contents)
 
         if img is None:
             raise HTTPException(status_code=400, detail="Imagem inválida")
 
-        # Verifica se o modelo está carregado
-        if modelo is None:
-            raise HTTPException(status_code=503, detail="Modelo não está disponível no momento")
-            
-        # Processa a imagem com o modelo YOLO
-        resultados = modelo.predict(source=img, conf=0.5, device=device, verbose=False)
-
-        # Pega o primeiro resultado
-        resultado = resultados[0]
+        # Processa a imagem com o modelo YOLO, em lote com as câmeras ativas
+        boxes = await asyncio.wrap_future(scheduler.submit(f"usb:{uuid.uuid4().hex}", img, 0.5))
 
-        num_faces = len(resultado.boxes)
+        num_faces = len(boxes)
 
         return {
             "face_count": num_faces,
             "status": "success"
         }
 
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"[ERRO] Erro ao processar frame USB: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        usb_admission.release()
+        M_USB.observe(time.perf_counter() - inicio, "process_usb_frame")
+
+@app.websocket("/ws/usb")
+async def usb_websocket(websocket: WebSocket, token: Optional[str] = Query(None)):
+    """
+    Canal persistente para frames de câmeras USB.
+
+    O cliente autentica uma vez (parâmetro `token` ou cabeçalho Authorization) e envia
+    mensagens binárias no formato: 4 bytes big-endian com o número de sequência + JPEG.
+    Cada frame processado gera uma resposta JSON com o mesmo `seq`. O cliente pode enviar
+    sem aguardar respostas; se chegar um frame novo antes de o anterior entrar na
+    inferência, o anterior é descartado e respondido com `status: "dropped"`.
+    """
+    auth = websocket.headers.get("Authorization", "")
+    if token is None and auth.startswith("Bearer "):
+        token = auth.split(" ")[1]
+    try:
+        decode_token(token or "")
+    except HTTPException:
+        await websocket.close(code=1008)
+        return
+    await websocket.accept()
+
+    pendente: Optional[Tuple[int, bytes]] = None
+    novo_frame = asyncio.Event()
+    envio_lock = asyncio.Lock()
+    loop = asyncio.get_running_loop()
+
+    async def enviar(mensagem: dict):
+        async with envio_lock:
+            await websocket.send_json(mensagem)
+
+    async def _processar():
+        nonlocal pendente
+        while True:
+            await novo_frame.wait()
+            novo_frame.clear()
+            if pendente is None:
+                continue
+            seq, contents = pendente
+            pendente = None
+
+            if modelo is None or not usb_admission.try_acquire():
+                await enviar({"seq": seq, "status": "overloaded"})
+                continue
+            inicio = time.perf_counter()
+            try:
+                img = await loop.run_in_executor(decode_executor, decode_frame, contents)
+                if img is None:
+                    await enviar({"seq": seq, "status": "invalid_image"})
+                    continue
+                boxes = await asyncio.wrap_future(scheduler.submit(f"usb:{uuid.uuid4().hex}", img, 0.5))
+                await enviar({"seq": seq, "face_count": len(boxes), "boxes": boxes_to_list(boxes), "status": "success"})
+            except Exception as e:
+                print(f"[ERRO] Erro ao processar frame USB via WebSocket: {e}")
+                await enviar({"seq": seq, "status": "error"})
+            finally:
+                usb_admission.release()
+                M_USB.observe(time.perf_counter() - inicio, "ws_usb")
+
+    async def processar():
+        try:
+            await _processar()
+        except (WebSocketDisconnect, RuntimeError):
+            # Conexão encerrada durante o envio
+            pass
+
+    worker = asyncio.create_task(processar())
+    try:
+        while True:
+            mensagem = await websocket.receive()
+            if mensagem["type"] == "websocket.disconnect":
+                break
+            dados = mensagem.get("bytes")
+            if not dados or len(dados) < 4:
+                await enviar({"status": "error", "detail": "Esperado frame binário: seq (4 bytes) + JPEG"})
+                continue
+            if pendente is not None:
+                # Inferência ocupada: o frame mais recente substitui o que ainda aguardava
+                await enviar({"seq": pendente[0], "status": "dropped"})
+            pendente = (int.from_bytes(dados[:4], "big"), dados[4:])
+            novo_frame.set()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        worker.cancel()
+
+@app.post("/process_usb_frames/", summary="Processa vários frames de câmeras USB em lote", dependencies=[Depends(verify_jwt)])
+def process_usb_frames(
+    frames: List[UploadFile] = File(...),
+    device_ids: Optional[List[str]] = Form(None),
+    conf: float = Form(0.5),
+):
+    """
+    Recebe vários frames (de vários dispositivos ou de uma janela curta de tempo),
+    decodifica-os em paralelo e executa uma única inferência em lote.
+    `device_ids`, se enviado, deve ter um identificador por frame, na mesma ordem.
+    """
+    if len(frames) > USB_BATCH_MAX_FRAMES:
+        raise HTTPException(status_code=413, detail=f"Máximo de {USB_BATCH_MAX_FRAMES} frames por requisição")
+    if device_ids is not None and len(device_ids) != len(frames):
+        raise HTTPException(status_code=400, detail="device_ids deve ter um item por frame")
+    if modelo is None:
+        raise HTTPException(status_code=503, detail="Modelo não está disponível no momento")
+    if not usb_admission.try_acquire(len(frames)):
+        reject_overload()
+    inicio = time.perf_counter()
+    try:
+        return _process_usb_batch(frames, device_ids, conf)
+    finally:
+        usb_admission.release(len(frames))
+        M_USB.observe(time.perf_counter() - inicio, "process_usb_frames")
+
+def _process_usb_batch(frames: List[UploadFile], device_ids: Optional[List[str]], conf: float):
+    imagens = list(decode_executor.map(decode_frame, [f.file.read() for f in frames]))
+
+    # Submete todos os frames válidos juntos para que o agendador os processe no mesmo lote
+    validos = [i for i, img in enumerate(imagens) if img is not None]
+    futures = scheduler.submit_many([(f"usb:{uuid.uuid4().hex}", imagens[i], conf, None) for i in validos])
+    deteccoes = dict(zip(validos, futures))
+
+    resultados = []
+    for i in range(len(frames)):
+        item = {"index": i, "device_id": device_ids[i] if device_ids else None}
+        if i not in deteccoes:
+            item.update({"face_count": 0, "boxes": [], "status": "invalid_image"})
+        else:
+            try:
+                boxes = deteccoes[i].result()
+                item.update({"face_count": len(boxes), "boxes": boxes_to_list(boxes), "status": "success"})
+            except Exception as e:
+                print(f"[ERRO] Erro ao processar frame USB em lote: {e}")
+                item.update({"face_count": 0, "boxes": [], "status": "error"})
+        resultados.append(item)
+
+    return {"results": resultados, "total_faces": sum(r["face_count"] for r in resultados)}
 
 @app.get("/faces_count_all", summary="Contagem de faces em todas as câmeras", dependencies=[Depends(verify_jwt)])
 def faces_count_all():
@@ -325,13 +1558,7 @@ def faces_count_all():
     Retorna uma lista com a contagem de faces de todas as câmeras ativas.
     """
     resposta = []
-    with frames_lock:
-        if not cameras_data:
-            return []
-        # Cria uma cópia para iterar com segurança
-        active_cameras = list(cameras_data.items())
-    
-    for ip, data in active_cameras:
-        resposta.append({"ip": ip, "count": data.get("face_count", 0)})
-        
+    for camera in camera_registry.all():
+        snapshot = camera.snapshot
+        resposta.append({"ip": camera.url, "count": snapshot.face_count, "dropped_frames": snapshot.dropped_frames})
     return resposta
\ No newline at end of file
@@ -8,6 +8,7 @@ echo "Variáveis de ambiente recebidas:"
 echo "PORT=${PORT:-não definida}"
 echo "WORKERS=${WORKERS:-1}"
 echo "TIMEOUT=${TIMEOUT:-600}"
+echo "INFERENCE_PROCESSES=${INFERENCE_PROCESSES:-0}"
 
 # Se PORT não estiver definida, usa o padrão 8000
 if [ -z "$PORT" ]; then
@@ -36,6 +37,8 @@ if [ -f /app/.env ]; then
 fi
 
 # Inicia a aplicação com uvicorn (recomendado para FastAPI)
+# O estado das câmeras vive em um único processo: para usar mais núcleos, aumente
+# INFERENCE_PROCESSES em vez de WORKERS.
 echo "Iniciando uvicorn na porta $PORT..."
 exec uvicorn \
     --host 0.0.0.0 \
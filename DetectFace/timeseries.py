@@ -0,0 +1,184 @@
+import queue
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+
+class CountSeries:
+    """
+    Buffer circular de (timestamp, contagem) de uma câmera, em arrays numpy pré-alocados.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = max(1, capacity)
+        self._ts = np.zeros(self.capacity, dtype=np.float64)
+        self._counts = np.zeros(self.capacity, dtype=np.int32)
+        self._head = 0
+        self._size = 0
+        self._lock = threading.Lock()
+        self.last_ts = 0.0
+        self.last_count: Optional[int] = None
+
+    def append(self, ts: float, count: int):
+        with self._lock:
+            self._ts[self._head] = ts
+            self._counts[self._head] = count
+            self._head = (self._head + 1) % self.capacity
+            self._size = min(self._size + 1, self.capacity)
+            self.last_ts, self.last_count = ts, count
+
+    @property
+    def oldest(self) -> Optional[float]:
+        with self._lock:
+            if not self._size:
+                return None
+            return float(self._ts[(self._head - self._size) % self.capacity])
+
+    def window(self, start: float, end: float):
+        """
+        Retorna cópias (timestamps, contagens) das amostras em [start, end), em ordem cronológica.
+        """
+        with self._lock:
+            inicio = (self._head - self._size) % self.capacity
+            indices = (np.arange(self._size) + inicio) % self.capacity
+            ts, counts = self._ts[indices], self._counts[indices]
+        mascara = (ts >= start) & (ts < end)
+        return ts[mascara], counts[mascara]
+
+
+def downsample(ts: np.ndarray, counts: np.ndarray, start: float, step: float) -> List[Dict]:
+    """
+    Agrupa as amostras em janelas de `step` segundos a partir de `start`, com min/max/média.
+    Janelas sem amostras são omitidas.
+    """
+    if not len(ts):
+        return []
+    janelas = ((ts - start) // step).astype(np.int64)
+    ids, inicios = np.unique(janelas, return_index=True)
+    n = np.diff(np.append(inicios, len(ts)))
+    minimos = np.minimum.reduceat(counts, inicios)
+    maximos = np.maximum.reduceat(counts, inicios)
+    somas = np.add.reduceat(counts.astype(np.float64), inicios)
+    return [
+        {"t": round(start + int(j) * step, 3), "min": int(mn), "max": int(mx), "avg": round(float(s / k), 3), "n": int(k)}
+        for j, mn, mx, s, k in zip(ids, minimos, maximos, somas, n)
+    ]
+
+
+class CountStore:
+    """
+    Histórico de contagem de faces por câmera.
+
+    Cada câmera tem um `CountSeries` em memória. Uma amostra é gravada quando a contagem
+    muda ou quando passa `sample_interval` segundos desde a última, então mínimos e máximos
+    são exatos sem guardar todos os frames. Opcionalmente, as amostras também são
+    acrescentadas a um banco SQLite por uma thread de escrita em lote; consultas a janelas
+    mais antigas que o buffer em memória são respondidas pelo banco.
+    """
+
+    def __init__(self, capacity: int = 100_000, sample_interval: float = 1.0,
+                 db_path: str = "", retention_days: float = 7.0, flush_interval: float = 1.0):
+        self.capacity = capacity
+        self.sample_interval = sample_interval
+        self.db_path = db_path
+        self.retention = retention_days * 86400
+        self.flush_interval = flush_interval
+        self._series: Dict[str, CountSeries] = {}
+        self._lock = threading.Lock()
+        self._pending: "queue.Queue[tuple]" = queue.Queue()
+        if db_path:
+            with self._connect() as db:
+                db.execute("CREATE TABLE IF NOT EXISTS face_counts (camera TEXT NOT NULL, ts REAL NOT NULL, count INTEGER NOT NULL)")
+                db.execute("CREATE INDEX IF NOT EXISTS face_counts_camera_ts ON face_counts (camera, ts)")
+            threading.Thread(target=self._writer, name="face-count-writer", daemon=True).start()
+
+    def _connect(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self.db_path, timeout=10)
+        db.execute("PRAGMA journal_mode=WAL")
+        return db
+
+    def series(self, camera: str) -> CountSeries:
+        # O lock global só é usado para criar séries; a leitura do dict dispensa o lock
+        serie = self._series.get(camera)
+        if serie is not None:
+            return serie
+        with self._lock:
+            serie = self._series.get(camera)
+            if serie is None:
+                serie = self._series[camera] = CountSeries(self.capacity)
+            return serie
+
+    def cameras(self) -> List[str]:
+        with self._lock:
+            return list(self._series)
+
+    def recorder(self, camera: str) -> Callable[[int], None]:
+        """
+        Retorna a função de gravação de uma câmera, com a série já resolvida. Usada pela
+        thread da câmera para não passar pelo lock global a cada frame.
+        """
+        serie = self.series(camera)
+
+        def gravar(count: int, ts: Optional[float] = None):
+            self._record(serie, camera, count, ts)
+
+        return gravar
+
+    def record(self, camera: str, count: int, ts: Optional[float] = None):
+        self._record(self.series(camera), camera, count, ts)
+
+    def _record(self, serie: CountSeries, camera: str, count: int, ts: Optional[float]):
+        ts = time.time() if ts is None else ts
+        if serie.last_count == count and ts - serie.last_ts < self.sample_interval:
+            return
+        serie.append(ts, count)
+        if self.db_path:
+            self._pending.put((camera, ts, int(count)))
+
+    def _writer(self):
+        db = self._connect()
+        ultima_limpeza = 0.0
+        while True:
+            lote = [self._pending.get()]
+            time.sleep(self.flush_interval)
+            while True:
+                try:
+                    lote.append(self._pending.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                with db:
+                    db.executemany("INSERT INTO face_counts (camera, ts, count) VALUES (?, ?, ?)", lote)
+                    if self.retention and time.time() - ultima_limpeza > 3600:
+                        db.execute("DELETE FROM face_counts WHERE ts < ?", (time.time() - self.retention,))
+                        ultima_limpeza = time.time()
+            except sqlite3.Error as e:
+                print(f"[ERRO] Falha ao gravar o histórico de contagem: {e}")
+
+    def _query_db(self, camera: str, start: float, end: float, step: float) -> List[Dict]:
+        with self._connect() as db:
+            linhas = db.execute(
+                "SELECT CAST((ts - ?) / ? AS INTEGER) AS janela, MIN(count), MAX(count), AVG(count), COUNT(*) "
+                "FROM face_counts WHERE camera = ? AND ts >= ? AND ts < ? GROUP BY janela ORDER BY janela",
+                (start, step, camera, start, end),
+            ).fetchall()
+        return [
+            {"t": round(start + j * step, 3), "min": mn, "max": mx, "avg": round(avg, 3), "n": n}
+            for j, mn, mx, avg, n in linhas
+        ]
+
+    def query(self, camera: str, start: float, end: float, step: float) -> List[Dict]:
+        """
+        Série agregada de `camera` em [start, end), em janelas de `step` segundos.
+        """
+        serie = self._series.get(camera)
+        oldest = serie.oldest if serie is not None else None
+        if self.db_path and (oldest is None or start < oldest):
+            return self._query_db(camera, start, end, step)
+        if serie is None:
+            return []
+        ts, counts = serie.window(start, end)
+        return downsample(ts, counts, start, step)
@@ -0,0 +1,134 @@
+import time
+from typing import List, Optional
+
+import numpy as np
+
+
+def iou_matrix(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """
+    Calcula a matriz de IoU entre dois conjuntos de caixas no formato (x1, y1, x2, y2).
+    """
+    if len(a) == 0 or len(b) == 0:
+        return np.zeros((len(a), len(b)), dtype=np.float32)
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-6)
+
+
+class Track:
+    """
+    Uma face rastreada: caixa atual, velocidade (pixels por frame) e histórico de presença.
+    """
+
+    __slots__ = ("id", "box", "score", "velocity", "hits", "misses", "first_seen", "last_seen",
+                 "_anchor", "_frames_since_anchor")
+
+    def __init__(self, track_id: int, detection: np.ndarray, now: float):
+        self.id = track_id
+        self.box = detection[:4].astype(np.float32)
+        self.score = float(detection[4]) if len(detection) > 4 else 1.0
+        self.velocity = np.zeros(4, dtype=np.float32)
+        self.hits = 1
+        self.misses = 0
+        self.first_seen = now
+        self.last_seen = now
+        self._anchor = self.box.copy()
+        self._frames_since_anchor = 0
+
+    @property
+    def dwell_seconds(self) -> float:
+        return self.last_seen - self.first_seen
+
+    def predict(self):
+        self.box = self.box + self.velocity
+        self._frames_since_anchor += 1
+
+    def correct(self, detection: np.ndarray, now: float):
+        box = detection[:4].astype(np.float32)
+        frames = max(1, self._frames_since_anchor)
+        # Suaviza a velocidade medida entre a última detecção e a atual
+        self.velocity = 0.5 * self.velocity + 0.5 * (box - self._anchor) / frames
+        self.box = box
+        self.score = float(detection[4]) if len(detection) > 4 else self.score
+        self._anchor = box.copy()
+        self._frames_since_anchor = 0
+        self.hits += 1
+        self.misses = 0
+        self.last_seen = now
+
+
+class IoUTracker:
+    """
+    Rastreador leve baseado em IoU com modelo de velocidade constante.
+
+    `update` recebe as detecções de um keyframe (array (N, 5+) com x1, y1, x2, y2, conf)
+    e associa cada uma ao rastro de maior IoU. Entre keyframes, `predict` propaga as
+    caixas pela velocidade estimada. Um rastro só é contado após `min_hits` detecções e
+    é mantido por até `max_misses` keyframes sem correspondência, o que evita que a
+    contagem oscile com falhas pontuais do detector.
+    """
+
+    def __init__(self, iou_threshold: float = 0.3, min_hits: int = 2, max_misses: int = 3):
+        self.iou_threshold = iou_threshold
+        self.min_hits = max(1, min_hits)
+        self.max_misses = max(0, max_misses)
+        self.tracks: List[Track] = []
+        self._next_id = 1
+
+    def predict(self):
+        for track in self.tracks:
+            track.predict()
+
+    def update(self, detections: np.ndarray, now: Optional[float] = None):
+        now = time.monotonic() if now is None else now
+        detections = np.asarray(detections, dtype=np.float32)
+        if detections.ndim != 2:
+            detections = detections.reshape(0, 6)
+        for track in self.tracks:
+            track.predict()
+
+        ious = iou_matrix(np.array([t.box for t in self.tracks], dtype=np.float32).reshape(-1, 4), detections[:, :4])
+        matched_tracks, matched_dets = set(), set()
+        # Associação gulosa: pares com maior IoU primeiro
+        for flat in np.argsort(-ious, axis=None):
+            ti, di = np.unravel_index(flat, ious.shape)
+            if ious[ti, di] < self.iou_threshold:
+                break
+            if ti in matched_tracks or di in matched_dets:
+                continue
+            self.tracks[ti].correct(detections[di], now)
+            matched_tracks.add(ti)
+            matched_dets.add(di)
+
+        for ti, track in enumerate(self.tracks):
+            if ti not in matched_tracks:
+                track.misses += 1
+        self.tracks = [t for t in self.tracks if t.misses <= self.max_misses]
+
+        for di, detection in enumerate(detections):
+            if di not in matched_dets:
+                self.tracks.append(Track(self._next_id, detection, now))
+                self._next_id += 1
+
+    def confirmed(self) -> List[Track]:
+        """
+        Rastros confirmados (detectados ao menos `min_hits` vezes) e ainda ativos.
+        """
+        return [t for t in self.tracks if t.hits >= self.min_hits]
+
+    def count(self) -> int:
+        return len(self.confirmed())
+
+    def boxes(self) -> np.ndarray:
+        """
+        Caixas dos rastros confirmados no mesmo formato (N, 6) das detecções, com o ID na última coluna.
+        """
+        tracks = self.confirmed()
+        if not tracks:
+            return np.empty((0, 6), dtype=np.float32)
+        return np.array([[*t.box, t.score, t.id] for t in tracks], dtype=np.float32)
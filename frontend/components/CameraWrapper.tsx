@@ -219,25 +219,56 @@ export default function CameraWrapper() {
     });
   };
 
-  // Função para buscar contagem de faces (via polling simples)
+  // Recebe a contagem de faces por Server-Sent Events: o DetectFace só envia quando muda
   useEffect(() => {
-    if (!jwt) return;
-    let isMounted = true;
-    const interval = setInterval(() => {
-      if (!isMounted) return;
-      ipCameras.forEach(cam => {
-        fetch(`${DETECTFACE_API}/faces_count?ip=${cam.ip}`, {
-          headers: { 'Authorization': `Bearer ${jwt}` }
-        })
-          .then(res => res.json())
-          .then(data => {
-            if (isMounted) setFaceCounts(prev => ({ ...prev, [cam.ip]: data.count }));
+    // EventSource só existe no navegador
+    if (Platform.OS !== 'web' || !jwt || ipCameras.length === 0) return;
+    let source: EventSource | null = null;
+    let retry: ReturnType<typeof setTimeout> | undefined;
+    let cancelled = false;
+
+    const reconnect = () => {
+      source?.close();
+      if (!cancelled) retry = setTimeout(connect, 3000);
+    };
+
+    // O EventSource não envia cabeçalhos: em vez do JWT, a URL leva um ticket curto, válido só para este stream
+    const connect = async () => {
+      try {
+        const response = await fetch(`${DETECTFACE_API}/faces_count/events/ticket`, {
+          method: 'POST',
+          headers: { 'Authorization': `Bearer ${jwt}` },
+        });
+        if (!response.ok) throw new Error(`HTTP ${response.status}`);
+        const { ticket } = await response.json();
+        if (cancelled) return;
+        const params = new URLSearchParams({ ticket });
+        ipCameras.forEach(cam => params.append('camera_url', cam.ip));
+        source = new EventSource(`${DETECTFACE_API}/faces_count/events?${params.toString()}`);
+        source.addEventListener('counts', (event) => {
+          const updates: { ip: string; count: number }[] = JSON.parse((event as MessageEvent).data);
+          setFaceCounts(prev => {
+            const next = { ...prev };
+            updates.forEach(u => { next[u.ip] = u.count; });
+            return next;
           });
-      });
-    }, 2000);
+        });
+        // A reconexão automática reusaria o ticket já expirado: reconecta com um novo
+        source.onerror = (err) => {
+          console.error('Erro no stream de contagem de faces:', err);
+          reconnect();
+        };
+      } catch (err) {
+        console.error('Erro ao obter ticket do stream de contagem:', err);
+        reconnect();
+      }
+    };
+
+    connect();
     return () => {
-      isMounted = false;
-      clearInterval(interval);
+      cancelled = true;
+      clearTimeout(retry);
+      source?.close();
     };
   }, [ipCameras, jwt]);
 
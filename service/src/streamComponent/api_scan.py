@@ -1,9 +1,19 @@
 from fastapi import FastAPI, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from concurrent.futures import ThreadPoolExecutor
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from typing import AsyncIterator, Dict, Iterable, Iterator, List, Optional, Tuple
+import asyncio
+import contextlib
 import ipaddress
-import socket
+import itertools
+import json
+import os
+import time
+import uuid
+
+from fingerprint import identificar_host, identificar_hosts, porta_aberta
+from scan_cache import ScanCache
 
 app = FastAPI()
 
@@ -16,29 +26,433 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Maior faixa aceita por varredura (um /14 por padrão)
+SCAN_MAX_HOSTS = int(os.getenv("SCAN_MAX_HOSTS", str(2 ** 18)))
+
 class ScanRequest(BaseModel):
     network: str  # Ex: "10.0.1.0/24"
     port: int = 80  # Porta padrão
+    ports: Optional[List[int]] = None  # Várias portas por host; substitui `port`
+    concurrency: int = Field(512, ge=1, le=4096)  # Conexões simultâneas desta varredura (todas somadas respeitam SCAN_MAX_CONNECTIONS)
+    timeout: float = Field(1.0, gt=0, le=10)  # Timeout (s) de cada tentativa de conexão
+    identify: bool = False  # Identifica câmeras (RTSP/HTTP) entre os hosts encontrados
+    use_cache: bool = True  # Reaproveita a varredura anterior e informa só as diferenças
+    refresh: bool = False  # Força a varredura completa mesmo com o cache válido
 
-def verificar_host(ip, port):
-    try:
-        with socket.create_connection((str(ip), port), timeout=1):
-            return str(ip)
-    except:
-        return None
+class IdentifyRequest(BaseModel):
+    hosts: List[str]
+    concurrency: int = Field(64, ge=1, le=1024)  # Hosts identificados ao mesmo tempo
+    timeout: float = Field(2.0, gt=0, le=10)
 
-@app.post("/scan")
-def scan_rede(request: ScanRequest):
+def parse_request(request: ScanRequest):
     try:
         rede = ipaddress.ip_network(request.network, strict=False)
     except ValueError:
         raise HTTPException(status_code=400, detail="Faixa de IP inválida.")
+    if rede.num_addresses > SCAN_MAX_HOSTS:
+        raise HTTPException(status_code=400, detail=f"Faixa muito grande (máximo de {SCAN_MAX_HOSTS} endereços).")
+    portas = sorted(set(request.ports or [request.port]))
+    if any(not 0 < p < 65536 for p in portas):
+        raise HTTPException(status_code=400, detail="Porta inválida.")
+    return rede, portas
+
+def alvos_da_rede(rede, portas: List[int], ignorar: Iterable[str] = ()) -> Iterator[Tuple[str, int]]:
+    """
+    Gera os pares (host, porta) da rede sob demanda, sem materializar a faixa.
+    """
+    ignorar = set(ignorar)
+    return ((ip, porta) for ip, porta in itertools.product(map(str, rede.hosts()), portas) if ip not in ignorar)
+
+async def varrer(alvos: Iterable[Tuple[str, int]], concurrency: int, timeout: float, stats: Optional[dict] = None) -> AsyncIterator[dict]:
+    """
+    Verifica os pares (host, porta) e produz cada porta aberta assim que é encontrada.
+
+    Os alvos são consumidos sob demanda: apenas `concurrency` tarefas existem ao mesmo
+    tempo e a faixa nunca é materializada em memória.
+    """
+    alvos = iter(alvos)
+    encontrados: asyncio.Queue = asyncio.Queue()
+    stats = stats if stats is not None else {}
+    stats.setdefault("verificados", 0)
+
+    async def trabalhador():
+        # O gerador é compartilhado: cada `next` roda no event loop, sem concorrência real
+        try:
+            for ip, porta in alvos:
+                if await porta_aberta(ip, porta, timeout):
+                    encontrados.put_nowait({"ip": ip, "port": porta})
+                stats["verificados"] += 1
+        except Exception as e:
+            # Ex.: descritores esgotados; a varredura falha em vez de marcar hosts como inativos
+            encontrados.put_nowait(e)
+        finally:
+            # Sinaliza o fim deste trabalhador
+            encontrados.put_nowait(None)
+
+    tarefas = [asyncio.create_task(trabalhador()) for _ in range(concurrency)]
+    restantes = len(tarefas)
+    try:
+        while restantes:
+            achado = await encontrados.get()
+            if achado is None:
+                restantes -= 1
+                continue
+            if isinstance(achado, Exception):
+                raise achado
+            yield achado
+    finally:
+        # Cliente desconectou ou a varredura falhou: cancela as conexões pendentes
+        for tarefa in tarefas:
+            tarefa.cancel()
+
+cache = ScanCache()
+
+async def descobrir(rede, portas: List[int], request: ScanRequest, resumo: dict) -> AsyncIterator[dict]:
+    """
+    Descoberta incremental: produz as portas abertas usando o cache da rede.
+
+    1. Hosts verificados há menos de `SCAN_HOST_TTL` são produzidos direto do cache (`cached: true`).
+    2. Hosts conhecidos com o TTL vencido são reverificados primeiro.
+    3. Só quando a última varredura completa tem mais de `SCAN_SWEEP_TTL` (ou com `refresh`)
+       o restante da faixa é varrido em busca de hosts novos.
+
+    Ao final, `resumo` recebe os hosts adicionados e removidos desde a última descoberta.
+    O chamador deve segurar `trava_da_rede`, pois a entrada inteira é lida e regravada.
+    """
+    if not request.use_cache:
+        async for achado in varrer(alvos_da_rede(rede, portas), request.concurrency, request.timeout, resumo):
+            yield achado
+        return
+
+    agora = time.time()
+    entrada = cache.entrada(ScanCache.chave(rede, portas))
+    hosts = entrada["hosts"]
+    anteriores = set(hosts)
+    vencidos = set(cache.vencidos(entrada, agora))
+    vivos: Dict[str, set] = {}
+
+    for ip in sorted(anteriores - vencidos, key=ipaddress.ip_address):
+        vivos[ip] = set(hosts[ip]["ports"])
+        for porta in hosts[ip]["ports"]:
+            yield {"ip": ip, "port": porta, "cached": True}
+
+    reverificar = ((ip, porta) for ip in sorted(vencidos, key=ipaddress.ip_address) for porta in portas)
+    async for achado in varrer(reverificar, request.concurrency, request.timeout, resumo):
+        vivos.setdefault(achado["ip"], set()).add(achado["port"])
+        yield achado
+
+    completa = request.refresh or cache.varredura_vencida(entrada, agora)
+    if completa:
+        async for achado in varrer(alvos_da_rede(rede, portas, ignorar=anteriores), request.concurrency, request.timeout, resumo):
+            vivos.setdefault(achado["ip"], set()).add(achado["port"])
+            yield achado
+        entrada["varredura"] = time.time()
+
+    verificado = time.time()
+    entrada["hosts"] = {
+        ip: {
+            "ports": sorted(ps),
+            "verificado": hosts[ip]["verificado"] if ip in anteriores - vencidos else verificado,
+            "fingerprint": hosts.get(ip, {}).get("fingerprint"),
+        }
+        for ip, ps in vivos.items()
+    }
+    cache.salvar()
+    resumo.update(
+        adicionados=sorted(set(vivos) - anteriores, key=ipaddress.ip_address),
+        removidos=sorted(anteriores - set(vivos), key=ipaddress.ip_address),
+        varredura_completa=completa,
+        hosts=entrada["hosts"],
+    )
+
+def trava_da_rede(rede, portas: List[int], request: ScanRequest):
+    """
+    Descobertas simultâneas da mesma rede se revezam: a segunda encontra o cache (e as
+    identificações) atualizados pela primeira em vez de sobrescrevê-los.
+    """
+    return cache.trava(ScanCache.chave(rede, portas)) if request.use_cache else contextlib.nullcontext()
+
+def fingerprint_em_cache(rede, portas: List[int], ip: str) -> Optional[dict]:
+    return cache.entrada(ScanCache.chave(rede, portas))["hosts"].get(ip, {}).get("fingerprint")
+
+def guardar_fingerprints(rede, portas: List[int], resultados: List[dict]):
+    """
+    Grava as identificações na entrada atual da rede (sem await: não intercala com outra descoberta).
+    """
+    hosts = cache.entrada(ScanCache.chave(rede, portas))["hosts"]
+    gravados = [r for r in resultados if r["ip"] in hosts]
+    for r in gravados:
+        hosts[r["ip"]]["fingerprint"] = r
+    if gravados:
+        cache.salvar()
+
+async def identificar_com_cache(rede, portas: List[int], ips: List[str], resumo: dict) -> List[dict]:
+    """
+    Identifica os hosts, reaproveitando a identificação em cache dos que não são novos.
+    """
+    novos = set(resumo.get("adicionados", ips))
+    resultados, pendentes = [], []
+    for ip in ips:
+        fingerprint = None if ip in novos else fingerprint_em_cache(rede, portas, ip)
+        if fingerprint:
+            resultados.append(fingerprint)
+        else:
+            pendentes.append(ip)
+    identificados = [r async for r in identificar_hosts(pendentes)]
+    guardar_fingerprints(rede, portas, identificados)
+    return resultados + identificados
+
+@app.post("/scan")
+async def scan_rede(request: ScanRequest):
+    """
+    Varre a rede e retorna os hosts com alguma das portas abertas ao final.
+    Com o cache (padrão), também retorna os hosts `adicionados` e `removidos` desde a última varredura.
+    """
+    rede, portas = parse_request(request)
+    portas_por_host = {}
+    resumo = {}
+    async with trava_da_rede(rede, portas, request):
+        async for achado in descobrir(rede, portas, request, resumo):
+            portas_por_host.setdefault(achado["ip"], []).append(achado["port"])
+
+        ativos = sorted(portas_por_host, key=ipaddress.ip_address)
+        resposta = {"ativos": ativos, "total": len(ativos), "portas": {ip: sorted(portas_por_host[ip]) for ip in ativos},
+                    "verificados": resumo.get("verificados", 0)}
+        if request.use_cache:
+            resposta.update(adicionados=resumo["adicionados"], removidos=resumo["removidos"],
+                            varredura_completa=resumo["varredura_completa"])
+        if request.identify:
+            identificados = await identificar_com_cache(rede, portas, ativos, resumo)
+            resposta["cameras"] = sorted((r for r in identificados if r["camera"]), key=lambda r: ipaddress.ip_address(r["ip"]))
+    return resposta
+
+async def eventos_da_varredura(rede, portas: List[int], request: ScanRequest, stats: dict) -> AsyncIterator[dict]:
+    """
+    Eventos de uma varredura, na ordem em que acontecem: um `{"ip", "port"}` por porta aberta,
+    um `{"ip", "fingerprint"}` por host identificado (com `identify`, em paralelo com a
+    varredura) e um evento final com `done: true`.
+
+    Com o cache, hosts já conhecidos reaproveitam a identificação anterior (`cached: true`)
+    e só os novos ou ainda não identificados são sondados.
+    """
+    inicio = time.monotonic()
+    total = 0
+    identificando = {}
+    identificados = []
+    vistos = set()
+    limite = asyncio.Semaphore(64)
+
+    async def identificar(ip: str) -> dict:
+        async with limite:
+            return await identificar_host(ip)
+
+    def evento_identificacao(tarefa) -> dict:
+        identificados.append(tarefa.result())
+        return {"ip": identificando.pop(tarefa), "fingerprint": tarefa.result()}
+
+    async with trava_da_rede(rede, portas, request):
+        try:
+            async for achado in descobrir(rede, portas, request, stats):
+                total += 1
+                yield achado
+                if request.identify and achado["ip"] not in vistos:
+                    vistos.add(achado["ip"])
+                    # Durante a descoberta, a entrada ainda contém só os hosts da descoberta anterior
+                    fingerprint = fingerprint_em_cache(rede, portas, achado["ip"]) if request.use_cache else None
+                    if fingerprint:
+                        yield {"ip": achado["ip"], "fingerprint": fingerprint, "cached": True}
+                    else:
+                        identificando[asyncio.create_task(identificar(achado["ip"]))] = achado["ip"]
+                for tarefa in [t for t in identificando if t.done()]:
+                    yield evento_identificacao(tarefa)
+            if identificando:
+                await asyncio.wait(list(identificando))
+                for tarefa in list(identificando):
+                    yield evento_identificacao(tarefa)
+        finally:
+            for tarefa in identificando:
+                tarefa.cancel()
+        if request.use_cache:
+            guardar_fingerprints(rede, portas, identificados)
+    final = {"done": True, "total": total, "verificados": stats.get("verificados", 0),
+             "duracao": round(time.monotonic() - inicio, 2)}
+    if request.use_cache:
+        final.update(adicionados=stats["adicionados"], removidos=stats["removidos"],
+                     varredura_completa=stats["varredura_completa"])
+    yield final
+
+@app.post("/scan/stream")
+async def scan_rede_stream(request: ScanRequest):
+    """
+    Varre a rede enviando cada porta aberta assim que é encontrada, em NDJSON
+    (uma linha por evento de `eventos_da_varredura`).
+    """
+    rede, portas = parse_request(request)
+
+    async def gen():
+        async for evento in eventos_da_varredura(rede, portas, request, {}):
+            yield json.dumps(evento) + "\n"
+
+    return StreamingResponse(gen(), media_type="application/x-ndjson")
+
+@app.post("/identify")
+async def identificar(request: IdentifyRequest):
+    """
+    Identifica câmeras entre os hosts informados e sugere a URL do stream de cada uma.
+    """
+    try:
+        hosts = [str(ipaddress.ip_address(h)) for h in request.hosts]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Endereço IP inválido.")
+    resultados = [r async for r in identificar_hosts(hosts, request.concurrency, request.timeout)]
+    resultados.sort(key=lambda r: ipaddress.ip_address(r["ip"]))
+    return {"hosts": resultados, "cameras": sum(1 for r in resultados if r["camera"])}
+
+# --- Jobs de varredura ---
+# O processo fica no ar e atende várias varreduras em paralelo; cada uma vira um job
+# consultável, acompanhável e cancelável.
+SCAN_MAX_JOBS = int(os.getenv("SCAN_MAX_JOBS", "8"))  # Jobs rodando ao mesmo tempo
+SCAN_JOB_RETENTION = float(os.getenv("SCAN_JOB_RETENTION", "600"))  # Tempo (s) que um job finalizado fica consultável
+
+class ScanJob:
+    """
+    Varredura em segundo plano. Os eventos ficam guardados, então qualquer número de
+    clientes pode acompanhar o job desde o início, inclusive depois de terminado.
+
+    Estados: running, done, cancelled e error.
+    """
+
+    def __init__(self, request: ScanRequest, rede, portas: List[int]):
+        self.id = uuid.uuid4().hex[:12]
+        self.request = request
+        self.rede = rede
+        self.portas = portas
+        self.status = "running"
+        self.error: Optional[str] = None
+        self.created = time.time()
+        self.finished: Optional[float] = None
+        self.stats: dict = {}
+        self.events: List[dict] = []
+        self._mudou = asyncio.Event()
+        self.task = asyncio.create_task(self._run())
+
+    def _notificar(self):
+        # Acorda quem está esperando e arma um novo evento para a próxima mudança
+        self._mudou.set()
+        self._mudou = asyncio.Event()
+
+    async def _run(self):
+        try:
+            async for evento in eventos_da_varredura(self.rede, self.portas, self.request, self.stats):
+                self.events.append(evento)
+                self._notificar()
+            self.status = "done"
+        except asyncio.CancelledError:
+            self.status = "cancelled"
+        except Exception as e:
+            self.status, self.error = "error", str(e)
+        finally:
+            self.finished = time.time()
+            self._notificar()
+
+    def cancel(self):
+        if self.finished is None:
+            self.task.cancel()
+
+    def progresso(self) -> dict:
+        # Limite superior: hosts válidos no cache não precisam de conexão
+        alvos = max(1, self.rede.num_addresses * len(self.portas))
+        verificados = self.stats.get("verificados", 0)
+        return {"verificados": verificados, "alvos": alvos, "percentual": round(min(100.0, 100.0 * verificados / alvos), 1)}
+
+    def resumo(self, detalhes: bool = True) -> dict:
+        resposta = {"id": self.id, "network": self.rede.with_prefixlen, "ports": self.portas, "status": self.status,
+                    "error": self.error, "created": self.created, "finished": self.finished, "progress": self.progresso()}
+        if detalhes:
+            ativos = {e["ip"] for e in self.events if "port" in e}
+            resposta["ativos"] = sorted(ativos, key=ipaddress.ip_address)
+            resposta["cameras"] = [e["fingerprint"] for e in self.events if e.get("fingerprint", {}).get("camera")]
+            resposta["resultado"] = self.events[-1] if self.events and self.events[-1].get("done") else None
+        return resposta
+
+    async def seguir(self, intervalo: float = 1.0) -> AsyncIterator[dict]:
+        """
+        Produz os eventos já ocorridos e os próximos. Enquanto a varredura roda sem
+        achados, produz um evento `{"progress"}` a cada `intervalo` segundos.
+        """
+        enviados = 0
+        while True:
+            mudou = self._mudou
+            while enviados < len(self.events):
+                yield self.events[enviados]
+                enviados += 1
+            if self.finished is not None:
+                if self.status != "done":
+                    yield {"done": True, "status": self.status, "error": self.error}
+                return
+            try:
+                await asyncio.wait_for(mudou.wait(), intervalo)
+            except asyncio.TimeoutError:
+                yield {"progress": self.progresso()}
+
+jobs: Dict[str, ScanJob] = {}
+
+def get_job(job_id: str) -> ScanJob:
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job não encontrado.")
+    return job
+
+@app.post("/jobs", status_code=202)
+async def criar_job(request: ScanRequest):
+    """
+    Inicia uma varredura em segundo plano e retorna o job imediatamente.
+    """
+    rede, portas = parse_request(request)
+    agora = time.time()
+    for job_id, job in list(jobs.items()):
+        if job.finished is not None and agora - job.finished > SCAN_JOB_RETENTION:
+            del jobs[job_id]
+    if sum(1 for j in jobs.values() if j.finished is None) >= SCAN_MAX_JOBS:
+        raise HTTPException(status_code=429, detail=f"Limite de {SCAN_MAX_JOBS} varreduras simultâneas atingido.")
+    job = ScanJob(request, rede, portas)
+    jobs[job.id] = job
+    return job.resumo(detalhes=False)
+
+@app.get("/jobs")
+async def listar_jobs():
+    return [job.resumo(detalhes=False) for job in jobs.values()]
+
+@app.get("/jobs/{job_id}")
+async def consultar_job(job_id: str):
+    """
+    Estado, progresso e hosts encontrados até o momento (o resultado final quando terminado).
+    """
+    return get_job(job_id).resumo()
+
+@app.get("/jobs/{job_id}/stream")
+async def acompanhar_job(job_id: str):
+    """
+    Acompanha o job em NDJSON: repete os eventos já ocorridos e segue com os novos,
+    intercalando linhas `{"progress"}`, até a linha final com `done: true`.
+    Desconectar não cancela o job.
+    """
+    job = get_job(job_id)
+
+    async def gen():
+        async for evento in job.seguir():
+            yield json.dumps(evento) + "\n"
+
+    return StreamingResponse(gen(), media_type="application/x-ndjson")
 
-    ips = list(rede.hosts())
-    ativos = []
+@app.delete("/jobs/{job_id}")
+async def cancelar_job(job_id: str):
+    job = get_job(job_id)
+    job.cancel()
+    return {"id": job.id, "status": job.status if job.finished is not None else "cancelling"}
 
-    with ThreadPoolExecutor(max_workers=100) as executor:
-        resultados = executor.map(lambda ip: verificar_host(ip, request.port), ips)
-        ativos = [ip for ip in resultados if ip]
 
-    return {"ativos": ativos, "total": len(ativos)}
+if __name__ == "__main__":
+    # Serviço persistente: sobe uma vez e atende todas as varreduras
+    import uvicorn
+    uvicorn.run(app, host=os.getenv("SCANNER_HOST", "127.0.0.1"), port=int(os.getenv("SCANNER_PORT", "5000")))
@@ -0,0 +1,357 @@
+"""
+Identificação de câmeras entre os hosts encontrados na varredura.
+
+Para cada host, as sondagens rodam em paralelo:
+    - RTSP: OPTIONS seguido de DESCRIBE nos caminhos mais comuns, na mesma conexão;
+    - HTTP: requisições HEAD com keep-alive (cabeçalho Server, realm de autenticação e
+      caminhos típicos de câmeras/ONVIF).
+
+O resultado classifica o host como câmera ou não e sugere uma URL de stream que pode
+ser enviada diretamente ao `/start_camera/` do DetectFace (sem credenciais).
+"""
+import asyncio
+import errno
+import itertools
+import os
+import weakref
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Tuple
+
+RTSP_PORTS = (554, 8554)
+HTTP_PORTS = (80, 8080, 8000, 88)
+USER_AGENT = "LNS-Fingerprint/1.0"
+# Maior corpo de resposta lido; respostas maiores encerram a conexão
+MAX_BODY = 65536
+
+# Caminho RTSP do stream principal por fabricante
+VENDOR_RTSP_PATHS = {
+    "hikvision": "/Streaming/Channels/101",
+    "dahua": "/cam/realmonitor?channel=1&subtype=0",
+    "intelbras": "/cam/realmonitor?channel=1&subtype=0",
+    "amcrest": "/cam/realmonitor?channel=1&subtype=0",
+    "axis": "/axis-media/media.amp",
+    "reolink": "/h264Preview_01_main",
+    "tapo": "/stream1",
+    "uniview": "/media/video1",
+    "vivotek": "/live.sdp",
+    "hipcam": "/11",
+}
+# Caminhos tentados no DESCRIBE quando o fabricante é desconhecido
+RTSP_PATHS = ("/", "/live", "/stream1", "/h264", "/11", "/Streaming/Channels/101",
+              "/cam/realmonitor?channel=1&subtype=0", "/live/ch00_0")
+# Stream MJPEG por HTTP, para câmeras sem RTSP
+VENDOR_HTTP_PATHS = {
+    "axis": "/axis-cgi/mjpg/video.cgi",
+    "foscam": "/videostream.cgi",
+    "netwave": "/videostream.cgi",
+}
+VENDOR_KEYWORDS = {
+    "hikvision": ("hikvision", "dnvrs-webs", "app-webs"),
+    "dahua": ("dahua",),
+    "intelbras": ("intelbras",),
+    "amcrest": ("amcrest",),
+    "axis": ("axis",),
+    "reolink": ("reolink",),
+    "tapo": ("tapo", "tp-link"),
+    "uniview": ("uniview", "unv"),
+    "vivotek": ("vivotek",),
+    "hipcam": ("hipcam",),
+    "foscam": ("foscam",),
+    "netwave": ("netwave",),
+}
+# Palavras que indicam um dispositivo de vídeo, sem identificar o fabricante
+CAMERA_KEYWORDS = ("camera", "ipcam", "webcam", "dvr", "nvr", "onvif", "rtsp", "streaming")
+# Caminhos HTTP típicos de câmeras: uma resposta diferente da de um caminho inexistente é indício
+HTTP_PATHS = ("/onvif/device_service", "/ISAPI/System/deviceInfo", "/cgi-bin/magicBox.cgi?action=getDeviceType")
+HTTP_CONTROL_PATH = "/lns-caminho-inexistente"
+
+Resposta = Tuple[int, Dict[str, str], bytes]
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def _limite_padrao() -> int:
+    # Deixa folga de descritores para o servidor HTTP, o cache e os clientes
+    if resource is None:
+        return 1024
+    soft, _ = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft == resource.RLIM_INFINITY:
+        return 4096
+    return max(64, min(4096, soft - 256))
+
+
+# Conexões de saída simultâneas no processo, somando varreduras e identificações de todos os jobs
+SCAN_MAX_CONNECTIONS = int(os.getenv("SCAN_MAX_CONNECTIONS", "0")) or _limite_padrao()
+# Falta de descritores no processo: não diz nada sobre o host remoto
+ERROS_DESCRITORES = (errno.EMFILE, errno.ENFILE)
+TENTATIVAS_DESCRITORES = 5
+
+_limites: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+
+
+def limite_conexoes() -> asyncio.Semaphore:
+    """
+    Semáforo de conexões do event loop atual, compartilhado por todas as varreduras.
+    """
+    loop = asyncio.get_running_loop()
+    limite = _limites.get(loop)
+    if limite is None:
+        limite = _limites[loop] = asyncio.Semaphore(SCAN_MAX_CONNECTIONS)
+    return limite
+
+
+async def abrir_conexao(host: str, port: int, timeout: float):
+    """
+    Abre uma conexão TCP. Com os descritores esgotados (EMFILE/ENFILE), tenta de novo
+    algumas vezes e então propaga o erro, em vez de o host parecer inacessível.
+    """
+    for tentativa in range(TENTATIVAS_DESCRITORES):
+        try:
+            return await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+        except OSError as e:
+            if e.errno not in ERROS_DESCRITORES or tentativa == TENTATIVAS_DESCRITORES - 1:
+                raise
+            await asyncio.sleep(0.1 * 2 ** tentativa)
+
+
+async def porta_aberta(host: str, port: int, timeout: float) -> bool:
+    """
+    Tenta abrir uma conexão TCP sem bloquear o event loop, dentro do limite de conexões
+    do processo. Falta de descritores levanta OSError em vez de retornar False.
+    """
+    async with limite_conexoes():
+        try:
+            _, writer = await abrir_conexao(host, port, timeout)
+        except (OSError, asyncio.TimeoutError) as e:
+            if isinstance(e, OSError) and e.errno in ERROS_DESCRITORES:
+                raise
+            return False
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except OSError:
+            pass
+    return True
+
+
+def detectar_fabricante(*textos: str) -> Optional[str]:
+    texto = " ".join(t for t in textos if t).lower()
+    for fabricante, palavras in VENDOR_KEYWORDS.items():
+        if any(p in texto for p in palavras):
+            return fabricante
+    return None
+
+
+def extrair_realm(www_authenticate: str) -> str:
+    _, _, resto = www_authenticate.partition('realm="')
+    return resto.split('"', 1)[0]
+
+
+class Conexao:
+    """
+    Conexão TCP reaproveitada entre várias requisições ao mesmo host e porta.
+    Se o servidor fechar a conexão, ela é reaberta uma vez na requisição seguinte.
+    Enquanto aberta, ocupa uma vaga de `limite_conexoes()`.
+    """
+
+    def __init__(self, host: str, port: int, timeout: float):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._vaga: Optional[asyncio.Semaphore] = None
+
+    async def _abrir(self):
+        if self._vaga is None:
+            limite = limite_conexoes()
+            await limite.acquire()
+            self._vaga = limite
+        self._reader, self._writer = await abrir_conexao(self.host, self.port, self.timeout)
+
+    async def _ler(self, corpo: bool) -> Optional[Resposta]:
+        cabecalho = await asyncio.wait_for(self._reader.readuntil(b"\r\n\r\n"), self.timeout)
+        linhas = cabecalho.decode("latin-1").split("\r\n")
+        partes = linhas[0].split(" ", 2)
+        if len(partes) < 2 or not partes[0].startswith(("RTSP/", "HTTP/")) or not partes[1].isdigit():
+            return None
+        headers = {}
+        for linha in linhas[1:]:
+            nome, sep, valor = linha.partition(":")
+            if sep:
+                headers[nome.strip().lower()] = valor.strip()
+        dados = b""
+        tamanho = int(headers["content-length"]) if headers.get("content-length", "").isdigit() else 0
+        if corpo and tamanho:
+            dados = await asyncio.wait_for(self._reader.readexactly(min(tamanho, MAX_BODY)), self.timeout)
+        if headers.get("connection", "").lower() == "close" or (corpo and tamanho > MAX_BODY):
+            # Corpo truncado: o restante ficaria no buffer e seria lido como a próxima resposta
+            self.close()
+        return int(partes[1]), headers, dados
+
+    async def pedir(self, requisicao: str, corpo: bool = True) -> Optional[Resposta]:
+        """
+        Envia a requisição e lê a resposta. Retorna None se o host não responder no protocolo esperado.
+        """
+        for _ in range(2):
+            reutilizada = self._writer is not None
+            try:
+                if not reutilizada:
+                    await self._abrir()
+                self._writer.write(requisicao.encode())
+                await self._writer.drain()
+                return await self._ler(corpo)
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError) as e:
+                self.close()
+                if isinstance(e, OSError) and e.errno in ERROS_DESCRITORES:
+                    raise
+                if not reutilizada:
+                    return None
+        return None
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+        if self._vaga is not None:
+            self._vaga.release()
+            self._vaga = None
+
+
+async def sondar_rtsp(host: str, port: int, timeout: float) -> Optional[dict]:
+    """
+    Sonda um servidor RTSP: OPTIONS confirma o protocolo e DESCRIBE procura o caminho do stream.
+    """
+    conexao = Conexao(host, port, timeout)
+    cseq = itertools.count(1)
+    try:
+        resposta = await conexao.pedir(f"OPTIONS rtsp://{host}:{port}/ RTSP/1.0\r\nCSeq: {next(cseq)}\r\n"
+                                       f"User-Agent: {USER_AGENT}\r\n\r\n")
+        if resposta is None:
+            return None
+        _, headers, _ = resposta
+        info = {"port": port, "server": headers.get("server", ""), "public": headers.get("public", ""),
+                "realm": "", "path": None, "confirmed": False, "auth_required": False}
+
+        fabricante = detectar_fabricante(info["server"])
+        preferido = VENDOR_RTSP_PATHS.get(fabricante)
+        caminhos = ([preferido] if preferido else []) + [c for c in RTSP_PATHS if c != preferido]
+        for caminho in caminhos:
+            resposta = await conexao.pedir(f"DESCRIBE rtsp://{host}:{port}{caminho} RTSP/1.0\r\nCSeq: {next(cseq)}\r\n"
+                                           f"User-Agent: {USER_AGENT}\r\nAccept: application/sdp\r\n\r\n")
+            if resposta is None:
+                break
+            status, headers, corpo = resposta
+            if status == 200 and b"m=video" in corpo:
+                info.update(path=caminho, confirmed=True)
+                break
+            if status == 401:
+                # Sem credenciais não é possível distinguir os caminhos; fica o mais provável
+                info.update(path=caminho, auth_required=True, realm=extrair_realm(headers.get("www-authenticate", "")))
+                break
+        return info
+    finally:
+        conexao.close()
+
+
+async def sondar_http(host: str, port: int, timeout: float) -> Optional[dict]:
+    """
+    Sonda um servidor HTTP com requisições HEAD na mesma conexão.
+    """
+    conexao = Conexao(host, port, timeout)
+
+    def head(caminho: str) -> str:
+        return (f"HEAD {caminho} HTTP/1.1\r\nHost: {host}:{port}\r\nUser-Agent: {USER_AGENT}\r\n"
+                f"Connection: keep-alive\r\n\r\n")
+
+    try:
+        resposta = await conexao.pedir(head("/"), corpo=False)
+        if resposta is None:
+            return None
+        status, headers, _ = resposta
+        info = {"port": port, "status": status, "server": headers.get("server", ""),
+                "realm": extrair_realm(headers.get("www-authenticate", "")), "paths": []}
+
+        controle = await conexao.pedir(head(HTTP_CONTROL_PATH), corpo=False)
+        status_controle = controle[0] if controle else 404
+        for caminho in HTTP_PATHS:
+            resposta = await conexao.pedir(head(caminho), corpo=False)
+            if resposta is None:
+                break
+            if resposta[0] != status_controle and resposta[0] < 500:
+                info["paths"].append(caminho)
+        return info
+    finally:
+        conexao.close()
+
+
+def classificar(host: str, rtsp: List[dict], http: List[dict]) -> dict:
+    """
+    Combina as sondagens de um host em uma classificação e uma URL de stream provável.
+    """
+    textos = [i["server"] for i in rtsp + http] + [i["realm"] for i in rtsp + http]
+    fabricante = detectar_fabricante(*textos)
+    resultado = {"ip": host, "camera": False, "confidence": None, "vendor": fabricante,
+                 "rtsp_port": None, "http_port": None, "auth_required": False, "stream_url": None}
+    if http:
+        principal = max(http, key=lambda i: len(i["paths"]))
+        resultado["http_port"] = principal["port"]
+        resultado["auth_required"] = principal["status"] == 401
+
+    if rtsp:
+        servidor = max(rtsp, key=lambda i: (i["confirmed"], i["auth_required"]))
+        caminho = servidor["path"] or VENDOR_RTSP_PATHS.get(fabricante) or "/"
+        resultado.update(
+            camera=True,
+            confidence="alta" if servidor["confirmed"] or servidor["auth_required"] else "media",
+            rtsp_port=servidor["port"],
+            auth_required=servidor["auth_required"],
+            stream_url=f"rtsp://{host}:{servidor['port']}{caminho}",
+        )
+        return resultado
+
+    texto = " ".join(textos).lower()
+    if fabricante or any(i["paths"] for i in http):
+        resultado.update(camera=True, confidence="media")
+    elif any(p in texto for p in CAMERA_KEYWORDS):
+        resultado.update(camera=True, confidence="baixa")
+    if resultado["camera"] and fabricante in VENDOR_HTTP_PATHS:
+        resultado["stream_url"] = f"http://{host}:{resultado['http_port']}{VENDOR_HTTP_PATHS[fabricante]}"
+    return resultado
+
+
+async def identificar_host(host: str, timeout: float = 2.0, rtsp_ports: Iterable[int] = RTSP_PORTS,
+                           http_ports: Iterable[int] = HTTP_PORTS) -> dict:
+    """
+    Executa todas as sondagens de um host em paralelo e retorna a classificação.
+    """
+    rtsp_ports, http_ports = list(rtsp_ports), list(http_ports)
+    resultados = await asyncio.gather(
+        *(sondar_rtsp(host, p, timeout) for p in rtsp_ports),
+        *(sondar_http(host, p, timeout) for p in http_ports),
+    )
+    rtsp = [r for r in resultados[:len(rtsp_ports)] if r]
+    http = [r for r in resultados[len(rtsp_ports):] if r]
+    return classificar(host, rtsp, http)
+
+
+async def identificar_hosts(hosts: Iterable[str], concurrency: int = 64, timeout: float = 2.0) -> AsyncIterator[dict]:
+    """
+    Identifica vários hosts com no máximo `concurrency` hosts em sondagem ao mesmo tempo,
+    produzindo cada resultado assim que fica pronto.
+    """
+    limite = asyncio.Semaphore(concurrency)
+
+    async def identificar(host: str) -> dict:
+        async with limite:
+            return await identificar_host(host, timeout)
+
+    tarefas = [asyncio.create_task(identificar(h)) for h in dict.fromkeys(hosts)]
+    try:
+        for proxima in asyncio.as_completed(tarefas):
+            yield await proxima
+    finally:
+        for tarefa in tarefas:
+            tarefa.cancel()
@@ -1,5 +1,10 @@
-from fastapi import FastAPI, Response, Query, HTTPException
+from fastapi import FastAPI, Query, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
+from typing import AsyncIterator, Dict, Optional
+import asyncio
+import os
+import threading
 import cv2
 
 app = FastAPI()
@@ -19,39 +24,202 @@ def read_root():
     return {"status": "Servidor de câmeras rodando 🚀"}
 
 
-@app.get("/video_feed")
-def video_feed(ip: str = Query(..., description="IP da câmera no formato ip:porta ou apenas ip")):
-    def generate_frames(ip_address):
+# Tempo (s) sem frame novo até o espectador desistir da câmera
+RELAY_FRAME_TIMEOUT = float(os.getenv("RELAY_FRAME_TIMEOUT", "10"))
+
+
+def _entregar_chunk(fila: asyncio.Queue, chunk: Optional[bytes]):
+    """
+    Entrega um chunk à fila de um espectador (executado no event loop do espectador).
+    A fila guarda só o frame mais recente; `None` sinaliza o fim do stream.
+    """
+    if fila.full():
+        fila.get_nowait()
+    fila.put_nowait(chunk)
+
+
+class CameraRelay:
+    """
+    Uma única captura por câmera, compartilhada por todos os espectadores.
+
+    Uma thread lê a câmera e codifica cada frame em JPEG uma só vez e o entrega à fila
+    (asyncio) de cada espectador, que guarda só o frame mais recente: quem está lento pula
+    frames em vez de acumular, e nenhum espectador ocupa uma thread enquanto espera.
+    A captura é encerrada quando o último espectador sai ou quando a câmera para de responder.
+    """
+
+    def __init__(self, ip_address: str):
+        self.ip = ip_address
         # 🔐 Substitua aqui pelo usuário e senha corretos da sua câmera
-        url = f"http://admin:senha@{ip_address}"
+        self.url = f"http://admin:senha@{ip_address}"
+        self.viewers = 0
+        self.frames = 0
+        self._cap = None
+        self._running = False
+        self._abrindo = False
+        # Encerrado (último espectador saiu ou a câmera falhou): nunca reabre a captura
+        self._fechado = False
+        self._cond = threading.Condition()
+        self._assinantes: Dict[asyncio.Queue, asyncio.AbstractEventLoop] = {}
+
+    def start(self) -> bool:
+        """
+        Abre a câmera no primeiro espectador. Retorna False se não for possível acessá-la.
+        """
+        with self._cond:
+            # Outro espectador já está abrindo a câmera: aguarda o resultado dele
+            self._cond.wait_for(lambda: not self._abrindo)
+            if self._running or self._fechado:
+                return self._running
+            self._abrindo = True
+
+        # A conexão pode levar todo o timeout; fora do lock para não travar stop() e os espectadores
+        cap = cv2.VideoCapture(self.url)
+        aberta = cap.isOpened()
+
+        with self._cond:
+            self._abrindo = False
+            if aberta and not self._fechado:
+                self._cap = cap
+                self._running = True
+                threading.Thread(target=self._capturar, name=f"relay-{self.ip}", daemon=True).start()
+            else:
+                self._fechado = True
+            self._cond.notify_all()
+            iniciado = self._running
+        if not iniciado:
+            cap.release()
+            descartar_relay(self)
+        return iniciado
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._fechado = True
+            self._cond.notify_all()
+            assinantes = list(self._assinantes.items())
+        self._distribuir(assinantes, None)
+
+    def _distribuir(self, assinantes, chunk: Optional[bytes]):
+        for fila, loop in assinantes:
+            try:
+                loop.call_soon_threadsafe(_entregar_chunk, fila, chunk)
+            except RuntimeError:
+                # Event loop já encerrado
+                self.desassinar(fila)
+
+    def assinar(self) -> asyncio.Queue:
+        """
+        Registra a fila de um espectador. Deve ser chamado de dentro do event loop.
+        """
+        fila = asyncio.Queue(maxsize=1)
+        with self._cond:
+            if self._running:
+                self._assinantes[fila] = asyncio.get_running_loop()
+            else:
+                fila.put_nowait(None)
+        return fila
 
-        cap = cv2.VideoCapture(url)
+    def desassinar(self, fila: asyncio.Queue):
+        with self._cond:
+            self._assinantes.pop(fila, None)
 
-        if not cap.isOpened():
-            print(f"❌ Não foi possível abrir a câmera {ip_address}")
-            raise HTTPException(status_code=404, detail=f"Não foi possível acessar a câmera {ip_address}")
+    def _capturar(self):
+        cap = self._cap
+        try:
+            while self._running:
+                success, frame = cap.read()
+                if not success:
+                    print(f"❌ Falha ao capturar frame da câmera {self.ip}")
+                    break
 
-        while True:
-            success, frame = cap.read()
-            if not success:
-                print("❌ Falha ao capturar frame")
-                break
+                ret, buffer = cv2.imencode('.jpg', frame)
+                if not ret:
+                    print("❌ Falha ao codificar frame")
+                    continue
 
-            ret, buffer = cv2.imencode('.jpg', frame)
-            if not ret:
-                print("❌ Falha ao codificar frame")
-                continue
+                chunk = b'--frame\r\nContent-Type: image/jpeg\r\n\r\n' + buffer.tobytes() + b'\r\n'
+                with self._cond:
+                    self.frames += 1
+                    assinantes = list(self._assinantes.items())
+                self._distribuir(assinantes, chunk)
+        finally:
+            # Sai do registro antes de encerrar: novos espectadores criam outro relay
+            descartar_relay(self)
+            self.stop()
+            cap.release()
 
-            frame_bytes = buffer.tobytes()
+    async def stream(self) -> AsyncIterator[bytes]:
+        """
+        Frames MJPEG já codificados, a partir do próximo frame capturado.
+        """
+        fila = self.assinar()
+        try:
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(fila.get(), RELAY_FRAME_TIMEOUT)
+                except asyncio.TimeoutError:
+                    return
+                if chunk is None:
+                    return
+                yield chunk
+        finally:
+            self.desassinar(fila)
 
-            yield (
-                b'--frame\r\n'
-                b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n'
-            )
 
-        cap.release()
+relays: Dict[str, CameraRelay] = {}
+relays_lock = threading.Lock()
 
-    return Response(
-        generate_frames(ip),
+
+def descartar_relay(relay: CameraRelay):
+    with relays_lock:
+        if relays.get(relay.ip) is relay:
+            del relays[relay.ip]
+
+
+def assinar_relay(ip_address: str) -> CameraRelay:
+    with relays_lock:
+        relay = relays.get(ip_address)
+        if relay is None:
+            relay = relays[ip_address] = CameraRelay(ip_address)
+        relay.viewers += 1
+    return relay
+
+
+def cancelar_relay(relay: CameraRelay):
+    with relays_lock:
+        relay.viewers -= 1
+        if relay.viewers > 0:
+            return
+        if relays.get(relay.ip) is relay:
+            del relays[relay.ip]
+    # Último espectador saiu: libera a câmera
+    relay.stop()
+
+
+@app.get("/video_feed")
+async def video_feed(ip: str = Query(..., description="IP da câmera no formato ip:porta ou apenas ip")):
+    relay = assinar_relay(ip)
+    # Abrir a câmera bloqueia até o timeout da conexão: roda fora do event loop
+    if not await asyncio.get_running_loop().run_in_executor(None, relay.start):
+        cancelar_relay(relay)
+        print(f"❌ Não foi possível abrir a câmera {ip}")
+        raise HTTPException(status_code=404, detail=f"Não foi possível acessar a câmera {ip}")
+
+    async def generate_frames():
+        try:
+            async for chunk in relay.stream():
+                yield chunk
+        finally:
+            cancelar_relay(relay)
+
+    return StreamingResponse(
+        generate_frames(),
         media_type='multipart/x-mixed-replace; boundary=frame'
     )
+
+
+@app.get("/relays")
+def listar_relays():
+    with relays_lock:
+        return [{"ip": r.ip, "viewers": r.viewers, "frames": r.frames} for r in relays.values()]
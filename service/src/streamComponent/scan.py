@@ -1,6 +1,6 @@
 
-import requests, os, netifaces, socket, sys
-from concurrent.futures import ThreadPoolExecutor
+import os, netifaces, socket, sys, asyncio
+from fingerprint import identificar_hosts, porta_aberta
 
 
 if hasattr(sys, 'getwindowsversion'):
@@ -20,15 +20,10 @@ def GetDefaultGateway():
         return gateways['default'][netifaces.AF_INET][0]
 ################################################################################
 
-def TestPortNumber(host, port):
+def TestPortNumber(host, port, timeout=3):
 
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
-        sock.settimeout(3)
-        try:
-            sock.connect((host, port))
-            return True
-        except:
-            return False
+    # Mesma verificação usada pelo api_scan.py (fingerprint.porta_aberta)
+    return asyncio.run(porta_aberta(host, port, timeout))
 ################################################################################
 
 def SearchLocalAddress():
@@ -47,82 +42,35 @@ def SearchLocalAddress():
     for i in range(0, 255):
         hosts.append(ip_splt + str(i))
 
-    ports = [80]*len(hosts)
+    # Todas as conexões em um único event loop, em paralelo
+    async def sweep():
+        return await asyncio.gather(*(porta_aberta(host, 80, 3) for host in hosts))
 
-    with ThreadPoolExecutor(len(hosts)) as executor:
-        results = executor.map(TestPortNumber, hosts, ports)
-
-        for ip,is_open in zip(hosts,results):
-            if is_open:
-                retIP.append(ip)
-                print("> Online: " + ip + '\t'+ HttpGetRequest(ip))
+    for ip,is_open in zip(hosts,asyncio.run(sweep())):
+        if is_open:
+            retIP.append(ip)
 
+    IdentifyCameras(retIP)
     print('='*70)
     return retIP
 ################################################################################
 
-def HttpGetRequest(host):
-
-    url = "http://" + host
-    r = requests.get(url)
-    stato = ""
+def IdentifyCameras(hosts):
 
-    if r.status_code == 200:
-        stato = "<==[ Accessible from a browser"
-    elif r.status_code == 401:
-        stato = "<==[ Authentication required"
-    else:
-        stato = ""
+    # Sonda RTSP (OPTIONS/DESCRIBE) e HTTP (HEAD) de todos os hosts em paralelo
+    async def identify():
+        return [r async for r in identificar_hosts(hosts)]
 
-    return stato
+    for r in sorted(asyncio.run(identify()), key=lambda r: socket.inet_aton(r["ip"])):
+        if r["camera"]:
+            info = f'IP CAMERA ({r["confidence"]}) ' + (r["vendor"] or "") + ' ' + (r["stream_url"] or "")
+            if r["auth_required"]:
+                info += ' [auth]'
+        else:
+            info = ""
+        print("> Online: " + r["ip"] + '\t' + info)
 ################################################################################
 
-def PortScan(host, ports):
-
-    retPorts = []
-    serviceName = ""
-    print(f'Scanning ports for {host}...\n')
-
-    with ThreadPoolExecutor(len(ports)) as executor:
-        results = executor.map(TestPortNumber, [host]*len(ports), ports)
-
-        for port,is_open in zip(ports,results):
-            if is_open:
-                try:
-                    serviceName = socket.getservbyport(port, 'tcp');
-                except:
-                    serviceName = ""
-
-                if serviceName == "rtsp":
-                    data=[]
-                    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sk:
-                        sk.settimeout(3)
-                        try:
-                            sk.connect((host, port))
-                            sk.sendall(b".")
-                            buff = sk.recv(1024)
-
-                            if len(buff) > 10:
-                                data = str(buff)
-                                data = data.split('\\r\\n')
-
-                                if len(data) >= 3:
-                                    serviceName = "RTSP <==[ "+ data[2]
-                        except socket.error as err:
-                                pass
-
-
-                    #serviceName = serviceName + " <==[ IP CAMERA"
-
-                retPorts.append(port)
-                if port == 80:
-                    st = HttpGetRequest(host)
-                    print(f'> Port: 80 ' + '\t' + serviceName + ' ' + st )
-                else:
-                    print(f'> Port: {port} ' + '\t' + serviceName)
-    print('='*70)
-    return retPorts
-################################################################################
 setWindow("", 70, 40)
 clearScreen()
 print('█'*70)
@@ -137,16 +85,10 @@ INFORMATION:
     2) Scan the entire range (0/255) for IPs with the..
         port 80 open.
 
-    3) Perform a port scan on each IP found in the previous steps..
-        within the range 0/9999.
+    3) Identify IP cameras among the IPs found in the previous step..
+        (RTSP OPTIONS/DESCRIBE and HTTP probes on the camera ports).
 """)
 
 print('█'*70)
 
-addrs = SearchLocalAddress()
-ports = range(9999)
-found = []
-
-for addr in addrs:
-    ret = PortScan(addr, ports)
-    found.append([addr, ret])
\ No newline at end of file
+addrs = SearchLocalAddress()
\ No newline at end of file
@@ -0,0 +1,78 @@
+"""
+Cache persistente dos resultados de varredura, por rede e conjunto de portas.
+
+Cada entrada guarda os hosts vivos com as portas abertas, o instante da última
+verificação de cada host e o da última varredura completa. O arquivo JSON sobrevive
+entre execuções, então uma nova descoberta só precisa reverificar os hosts vencidos
+e, quando a varredura completa vence, procurar hosts novos.
+"""
+import asyncio
+import json
+import os
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+# Tempo (s) em que um host verificado é considerado vivo sem nova conexão
+SCAN_HOST_TTL = float(os.getenv("SCAN_HOST_TTL", "120"))
+# Tempo (s) entre varreduras completas da faixa em busca de hosts novos
+SCAN_SWEEP_TTL = float(os.getenv("SCAN_SWEEP_TTL", "900"))
+SCAN_CACHE_FILE = os.getenv("SCAN_CACHE_FILE", os.path.join(tempfile.gettempdir(), "lns_scan_cache.json"))
+
+
+class ScanCache:
+
+    def __init__(self, path: str = SCAN_CACHE_FILE, host_ttl: float = SCAN_HOST_TTL, sweep_ttl: float = SCAN_SWEEP_TTL):
+        self.path = path
+        self.host_ttl = host_ttl
+        self.sweep_ttl = sweep_ttl
+        self._entradas: Dict[str, dict] = {}
+        self._travas: Dict[str, asyncio.Lock] = {}
+        if path and os.path.exists(path):
+            try:
+                with open(path) as f:
+                    self._entradas = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"[AVISO] Cache de varredura ignorado ({e})")
+
+    @staticmethod
+    def chave(rede, portas: List[int]) -> str:
+        return f"{rede.with_prefixlen}|{','.join(map(str, sorted(portas)))}"
+
+    def entrada(self, chave: str) -> dict:
+        """
+        Retorna a entrada da chave: {"hosts": {ip: {"ports", "verificado", "fingerprint"}}, "varredura": ts}.
+        """
+        return self._entradas.setdefault(chave, {"hosts": {}, "varredura": 0.0})
+
+    def trava(self, chave: str) -> asyncio.Lock:
+        """
+        Lock da entrada: quem lê e regrava a entrada inteira deve segurá-lo.
+        """
+        return self._travas.setdefault(chave, asyncio.Lock())
+
+    def vencidos(self, entrada: dict, agora: Optional[float] = None) -> List[str]:
+        agora = time.time() if agora is None else agora
+        return [ip for ip, h in entrada["hosts"].items() if agora - h["verificado"] > self.host_ttl]
+
+    def varredura_vencida(self, entrada: dict, agora: Optional[float] = None) -> bool:
+        agora = time.time() if agora is None else agora
+        return agora - entrada["varredura"] > self.sweep_ttl
+
+    def salvar(self):
+        if not self.path:
+            return
+        # Escrita atômica: um processo interrompido não corrompe o cache
+        diretorio = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(diretorio, exist_ok=True)
+        fd, temporario = tempfile.mkstemp(dir=diretorio, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(self._entradas, f)
+            os.replace(temporario, self.path)
+        except OSError as e:
+            print(f"[AVISO] Falha ao salvar o cache de varredura: {e}")
+            try:
+                os.unlink(temporario)
+            except OSError:
+                pass
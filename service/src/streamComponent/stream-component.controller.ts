@@ -1,32 +1,82 @@
-import { Controller, Post, Req, UseGuards, Body } from '@nestjs/common';
+import { Controller, Post, Get, Delete, Req, Res, UseGuards, Body, Param, HttpException } from '@nestjs/common';
+import { Response } from 'express';
 import { JwtAuthGuard } from '../auth/guards/jwt-auth.guard';
-import { spawn } from 'child_process';
+
+// Serviço de varredura persistente (python3 src/streamComponent/api_scan.py)
+const scannerUrl = process.env.SCANNER_URL ?? 'http://127.0.0.1:5000';
 
 @Controller('stream')
 export class StreamComponentController {
+  private async scanner(path: string, init?: RequestInit) {
+    let response: globalThis.Response;
+    try {
+      response = await fetch(scannerUrl + path, {
+        ...init,
+        headers: { 'Content-Type': 'application/json', ...init?.headers },
+      });
+    } catch (e) {
+      throw new HttpException('Serviço de varredura indisponível', 502);
+    }
+    if (!response.ok) {
+      const body = await response.json().catch(() => ({}));
+      throw new HttpException(body.detail ?? 'Erro ao executar scan', response.status);
+    }
+    return response;
+  }
+
   @UseGuards(JwtAuthGuard)
   @Post('scan')
-  async scanNetwork(@Req() req) {
-    return new Promise((resolve, reject) => {
-      const py = spawn('python3', [
-        'src/streamComponent/api_scan.py'
-      ]);
-      let data = '';
-      let error = '';
-      py.stdout.on('data', (chunk) => { data += chunk; });
-      py.stderr.on('data', (chunk) => { error += chunk; });
-      py.on('close', (code) => {
-        if (code === 0) {
-          try {
-            resolve(JSON.parse(data));
-          } catch (e) {
-            resolve({ raw: data });
-          }
-        } else {
-          reject(error || 'Erro ao executar scan');
-        }
-      });
-    });
+  async scanNetwork(@Body() body) {
+    const response = await this.scanner('/scan', { method: 'POST', body: JSON.stringify(body) });
+    return response.json();
+  }
+
+  @UseGuards(JwtAuthGuard)
+  @Post('scan/jobs')
+  async createScanJob(@Body() body) {
+    const response = await this.scanner('/jobs', { method: 'POST', body: JSON.stringify(body) });
+    return response.json();
+  }
+
+  @UseGuards(JwtAuthGuard)
+  @Get('scan/jobs')
+  async listScanJobs() {
+    const response = await this.scanner('/jobs');
+    return response.json();
+  }
+
+  @UseGuards(JwtAuthGuard)
+  @Get('scan/jobs/:id')
+  async getScanJob(@Param('id') id: string) {
+    const response = await this.scanner(`/jobs/${encodeURIComponent(id)}`);
+    return response.json();
+  }
+
+  @UseGuards(JwtAuthGuard)
+  @Get('scan/jobs/:id/stream')
+  async streamScanJob(@Param('id') id: string, @Req() req, @Res() res: Response) {
+    // Repassa o NDJSON linha a linha; se o cliente desconectar, só o acompanhamento é encerrado
+    const controller = new AbortController();
+    req.on('close', () => controller.abort());
+    const response = await this.scanner(`/jobs/${encodeURIComponent(id)}/stream`, { signal: controller.signal });
+    res.setHeader('Content-Type', 'application/x-ndjson');
+    res.setHeader('Cache-Control', 'no-cache');
+    res.flushHeaders();
+    try {
+      for await (const chunk of response.body as any) {
+        res.write(chunk);
+      }
+    } catch (e) {
+      // Conexão com o cliente ou com o serviço encerrada
+    }
+    res.end();
+  }
+
+  @UseGuards(JwtAuthGuard)
+  @Delete('scan/jobs/:id')
+  async cancelScanJob(@Param('id') id: string) {
+    const response = await this.scanner(`/jobs/${encodeURIComponent(id)}`, { method: 'DELETE' });
+    return response.json();
   }
 
   @UseGuards(JwtAuthGuard)